@@ -0,0 +1,280 @@
+import os
+import sqlite3
+import time
+
+import http_client
+from json_stream import iter_json_array
+from title_matcher import normalize_title
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+APP_INDEX_PATH = os.path.join(script_dir, 'steam_apps.db')
+
+APP_LIST_URL = 'https://api.steampowered.com/ISteamApps/GetAppList/v2/'
+# STEAM_API_KEYがある場合は、前回の同期以降に変更されたアプリだけを取得できるこちらを使う
+STORE_APP_LIST_URL = 'https://api.steampowered.com/IStoreService/GetAppList/v1/'
+
+# 全件の再取得を行う間隔（秒）
+FULL_SYNC_MAX_AGE = 24 * 60 * 60
+STORE_PAGE_SIZE = 50000
+INSERT_BATCH_SIZE = 5000
+CHUNK_SIZE = 1 << 20
+
+
+class AppIndex:
+    # Steamのアプリ名→appidの索引をSQLiteに保存し、実行のたびに全件を読み込まずに済むようにする
+    def __init__(self, path=APP_INDEX_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS apps (
+                appid INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                last_modified INTEGER,
+                normalized_name TEXT
+            );
+            CREATE INDEX IF NOT EXISTS apps_name ON apps (name);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS title_map (
+                twitch_id TEXT PRIMARY KEY,
+                steam_appid INTEGER NOT NULL,
+                twitch_name TEXT,
+                method TEXT,
+                matched_at INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS title_guesses (
+                twitch_id TEXT PRIMARY KEY,
+                steam_appid INTEGER,
+                twitch_name TEXT,
+                score REAL,
+                checked_at INTEGER
+            );
+        """)
+        self._migrate_normalized_names()
+        self._migrate_fuzzy_mappings()
+        self.conn.execute("CREATE INDEX IF NOT EXISTS apps_normalized_name ON apps (normalized_name)")
+        self.fuzzy_enabled = self._create_trigram_index()
+        self.conn.commit()
+
+    def _migrate_normalized_names(self):
+        # 正規化した名前の列がない古い索引には列を追加して埋める
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(apps)")]
+        if 'normalized_name' in columns:
+            return
+        self.conn.execute("ALTER TABLE apps ADD COLUMN normalized_name TEXT")
+        self.conn.create_function('normalize_title', 1, normalize_title, deterministic=True)
+        self.conn.execute("UPDATE apps SET normalized_name = normalize_title(name)")
+
+    def _migrate_fuzzy_mappings(self):
+        # 以前はあいまい一致の結果も確定した対応として保存していたため、取り除いて照合し直させる
+        self.conn.execute("DELETE FROM title_map WHERE method = 'fuzzy'")
+
+    def _create_trigram_index(self):
+        # あいまい一致の候補を探すためのトライグラム索引（FTS5のtrigramトークナイザが必要）
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'apps_trigram'"
+        ).fetchone()
+        if exists:
+            return True
+        try:
+            self.conn.executescript("""
+                CREATE VIRTUAL TABLE apps_trigram USING fts5(
+                    normalized_name, content='apps', content_rowid='appid', tokenize='trigram'
+                );
+                CREATE TRIGGER apps_trigram_insert AFTER INSERT ON apps BEGIN
+                    INSERT INTO apps_trigram (rowid, normalized_name) VALUES (new.appid, new.normalized_name);
+                END;
+                CREATE TRIGGER apps_trigram_delete AFTER DELETE ON apps BEGIN
+                    INSERT INTO apps_trigram (apps_trigram, rowid, normalized_name)
+                    VALUES ('delete', old.appid, old.normalized_name);
+                END;
+                CREATE TRIGGER apps_trigram_update AFTER UPDATE OF normalized_name ON apps BEGIN
+                    INSERT INTO apps_trigram (apps_trigram, rowid, normalized_name)
+                    VALUES ('delete', old.appid, old.normalized_name);
+                    INSERT INTO apps_trigram (rowid, normalized_name) VALUES (new.appid, new.normalized_name);
+                END;
+                INSERT INTO apps_trigram (apps_trigram) VALUES ('rebuild');
+            """)
+        except sqlite3.OperationalError as e:
+            print(f"トライグラム索引を作成できないため、あいまい一致は行いません: {e}")
+            return False
+        return True
+
+    def get(self, name, default=None):
+        # 同名のアプリが複数ある場合はappidが最も大きいものを返す
+        row = self.conn.execute(
+            "SELECT appid FROM apps WHERE name = ? ORDER BY appid DESC LIMIT 1", (name,)
+        ).fetchone()
+        return row[0] if row else default
+
+    def get_normalized(self, normalized_name, default=None):
+        row = self.conn.execute(
+            "SELECT appid FROM apps WHERE normalized_name = ? ORDER BY appid DESC LIMIT 1", (normalized_name,)
+        ).fetchone()
+        return row[0] if row else default
+
+    def fuzzy_candidates(self, grams, limit=20):
+        # トライグラムを多く共有するアプリを関連度順に（appid, 正規化した名前, 名前）で返す
+        if not self.fuzzy_enabled or not grams:
+            return []
+        query = ' OR '.join('"' + gram.replace('"', '""') + '"' for gram in sorted(grams))
+        return self.conn.execute("""
+            SELECT apps.appid, apps.normalized_name, apps.name
+            FROM apps_trigram JOIN apps ON apps.appid = apps_trigram.rowid
+            WHERE apps_trigram MATCH ?
+            ORDER BY rank LIMIT ?
+        """, (query, limit)).fetchall()
+
+    def get_mapping(self, twitch_id):
+        row = self.conn.execute(
+            "SELECT steam_appid FROM title_map WHERE twitch_id = ?", (str(twitch_id),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def save_mapping(self, twitch_id, steam_appid, twitch_name=None, method=None):
+        self.conn.execute("""
+            INSERT INTO title_map (twitch_id, steam_appid, twitch_name, method, matched_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (twitch_id) DO UPDATE SET
+                steam_appid = excluded.steam_appid,
+                twitch_name = excluded.twitch_name,
+                method = excluded.method,
+                matched_at = excluded.matched_at
+        """, (str(twitch_id), steam_appid, twitch_name, method, int(time.time())))
+        self.conn.commit()
+
+    def get_guess(self, twitch_id):
+        # あいまい一致の結果と、見つからなかった照合の結果（steam_appid が None）
+        return self.conn.execute(
+            "SELECT steam_appid, twitch_name, checked_at FROM title_guesses WHERE twitch_id = ?", (str(twitch_id),)
+        ).fetchone()
+
+    def save_guess(self, twitch_id, steam_appid, twitch_name=None, score=None):
+        self.conn.execute("""
+            INSERT INTO title_guesses (twitch_id, steam_appid, twitch_name, score, checked_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (twitch_id) DO UPDATE SET
+                steam_appid = excluded.steam_appid,
+                twitch_name = excluded.twitch_name,
+                score = excluded.score,
+                checked_at = excluded.checked_at
+        """, (str(twitch_id), steam_appid, twitch_name, score, int(time.time())))
+        self.conn.commit()
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM apps").fetchone()[0]
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+        self.conn.commit()
+
+    def is_fresh(self, max_age=FULL_SYNC_MAX_AGE):
+        last_sync = self.get_meta('last_sync')
+        return last_sync is not None and time.time() - last_sync < max_age
+
+    def upsert(self, apps):
+        # アプリを一定件数ずつまとめて書き込む（一覧全体をメモリに載せない）
+        count = 0
+        batch = []
+        for app in apps:
+            name = app.get('name')
+            appid = app.get('appid')
+            if not name or not appid:
+                continue
+            batch.append((appid, name, app.get('last_modified'), normalize_title(name)))
+            if len(batch) >= INSERT_BATCH_SIZE:
+                self._write(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+            count += len(batch)
+        self.conn.commit()
+        return count
+
+    def _write(self, rows):
+        self.conn.executemany("""
+            INSERT INTO apps (appid, name, last_modified, normalized_name) VALUES (?, ?, ?, ?)
+            ON CONFLICT (appid) DO UPDATE SET
+                name = excluded.name,
+                last_modified = COALESCE(excluded.last_modified, apps.last_modified),
+                normalized_name = excluded.normalized_name
+            WHERE apps.name IS NOT excluded.name
+                OR apps.last_modified IS NOT COALESCE(excluded.last_modified, apps.last_modified)
+        """, rows)
+
+    def load_app_list(self, apps):
+        started = int(time.time())
+        count = self.upsert(apps)
+        self.set_meta('last_sync', started)
+        return count
+
+    def sync_full(self):
+        response = http_client.get(APP_LIST_URL, stream=True)
+        with response:
+            if response.status_code != 200:
+                print(f"Steam APIのリクエストに失敗しました。ステータスコード: {response.status_code}")
+                return 0
+            # レスポンス全体を response.json() で読み込まず、アプリを1件ずつ取り出す
+            apps = iter_json_array(response.iter_content(CHUNK_SIZE), key='apps')
+            return self.load_app_list(apps)
+
+    def sync_changes(self, api_key):
+        # 前回の同期以降に変更されたアプリだけを、appid順にページングしながら取得する
+        started = int(time.time())
+        since = self.get_meta('last_sync')
+        last_appid = 0
+        total = 0
+        while True:
+            params = {
+                'key': api_key,
+                'max_results': STORE_PAGE_SIZE,
+                'last_appid': last_appid,
+                'include_games': 'true',
+                'include_software': 'true'
+            }
+            if since is not None:
+                params['if_modified_since'] = since
+            response = http_client.get(STORE_APP_LIST_URL, params=params, stream=True)
+            with response:
+                if response.status_code != 200:
+                    print(f"Steam APIのリクエストに失敗しました。ステータスコード: {response.status_code}")
+                    return total
+                page_appids = []
+
+                def track(apps):
+                    for app in apps:
+                        page_appids.append(app.get('appid', 0))
+                        yield app
+
+                total += self.upsert(track(iter_json_array(response.iter_content(CHUNK_SIZE), key='apps')))
+            if len(page_appids) < STORE_PAGE_SIZE:
+                break
+            last_appid = max(page_appids)
+        self.set_meta('last_sync', started)
+        return total
+
+    def refresh(self, max_age=FULL_SYNC_MAX_AGE, api_key=None):
+        # 差分の取得は STEAM_API_KEY がある場合だけ行える（実行のたびに前回以降の変更を取り込む）
+        # ない場合は索引が max_age より古くなったときだけ、全件の一覧をストリームで取り込み直す
+        api_key = api_key or os.getenv('STEAM_API_KEY')
+        if api_key:
+            return self.sync_changes(api_key)
+        if self.is_fresh(max_age):
+            return 0
+        return self.sync_full()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,61 @@
+import re
+
+
+def build_trie_pattern(words):
+    # 単語集合をトライ木に変換し、共通接頭辞をまとめた正規表現を組み立てる
+    # （各分岐は貪欲にマッチするため、同じ位置から始まる最長の単語にマッチする）
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            body = '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class AspectMatcher:
+    # アスペクトごとの表現辞書を1つの正規表現にまとめ、1回の走査で文がヒットしたアスペクトを求める
+    def __init__(self, aspects):
+        self.aspects = list(aspects)
+
+        expression_aspects = {}
+        for aspect, expressions in aspects.items():
+            for expr in expressions:
+                expression_aspects.setdefault(expr, set()).add(aspect)
+
+        # 同じ位置から始まる短い表現は最長一致に隠れるため、
+        # 接頭辞になっている表現のアスペクトもあらかじめ合成しておく
+        self.expression_aspects = {}
+        for expr in expression_aspects:
+            hit = set()
+            for other, other_aspects in expression_aspects.items():
+                if expr.startswith(other):
+                    hit |= other_aspects
+            self.expression_aspects[expr] = frozenset(hit)
+
+        # 先読みで各位置の最長一致を取り出すことで、重なり合う表現も漏らさず検出する
+        self.pattern = re.compile('(?=(' + build_trie_pattern(expression_aspects) + '))')
+
+        # トークン列にアスペクトの表現が含まれるかの判定用
+        self.token_sets = {aspect: frozenset(expressions) for aspect, expressions in aspects.items()}
+
+    def match(self, text):
+        hits = set()
+        for match in self.pattern.finditer(text):
+            hits |= self.expression_aspects[match.group(1)]
+            if len(hits) == len(self.aspects):
+                break
+        return hits
+
+    def tokens_hit(self, aspect, tokens):
+        return not self.token_sets[aspect].isdisjoint(tokens)
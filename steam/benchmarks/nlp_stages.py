@@ -0,0 +1,253 @@
+# レビュー解析の各段階（文分割・形態素解析・評価抽出・スコア計算・TF-IDF）の
+# 実行時間とピークメモリを、合成した日本語レビューで計測するベンチマーク
+# ネットワークには接続せず、fetch_and_parse_steam の関数をそのまま呼び出す
+#
+# steamディレクトリで実行する:
+#     python benchmarks/nlp_stages.py
+#     python benchmarks/nlp_stages.py --sizes 100 1000 10000 100000 --no-baseline
+#     python benchmarks/nlp_stages.py --sizes 100 1000 --no-baseline --output benchmarks/baseline.json
+#
+# 既定では、このスクリプトの隣の baseline.json と同じ件数で計測して比較し、許容範囲を超えて遅く
+# （またはメモリを多く）なった段階があれば表示して終了コード1で終了する
+# 実行時間はマシンに依存するため、別のマシンで比較する場合は先に --output で基準の結果を作り直す
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(script_dir, os.pardir))
+sys.path.append(parent_dir)
+
+import fetch_and_parse_steam as fps
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+DEFAULT_BASELINE = os.path.join(script_dir, 'baseline.json')
+WARMUP_SIZE = 100
+DEFAULT_SEED = 42
+# 文のうちアスペクトの表現を含むものの割合
+DEFAULT_ASPECT_DENSITY = 0.5
+# 1件のレビューに含まれる文の数の範囲
+SENTENCES_PER_REVIEW = (1, 8)
+# 各段階の実行時間を計測する回数（最小値を採用する）
+DEFAULT_REPEAT = 3
+# 基準からの許容する増加率と、揺れとして無視する差（秒・バイト）
+# 実行時間は同じマシンでも数十%揺れるため、数倍の悪化を検出できる程度に緩めにしている
+DEFAULT_TOLERANCE = 0.5
+DEFAULT_MEMORY_TOLERANCE = 0.10
+MIN_TIME_DIFF = 0.1
+MIN_MEMORY_DIFF = 64 * 1024
+
+STAGES = [
+    'split_sentences', 'tokenize_japanese', 'extract_evaluations',
+    'calculate_sentiment_scores', 'generate_word_weights'
+]
+
+ASPECT_TEMPLATES = [
+    "{aspect}が{word}",
+    "{aspect}はとても{word}と思う",
+    "この{aspect}は{word}でした",
+    "{aspect}について言えば{word}",
+    "正直{aspect}が{word}ので評価が分かれそう",
+]
+FILLER_TEMPLATES = [
+    "{noun}を{hours}時間プレイしました",
+    "{noun}と一緒に遊ぶと{noun2}が楽しめる",
+    "セールで{noun}を購入した",
+    "{noun}のアップデートを待っています",
+    "最初の{hours}時間は{noun}ばかりやっていた",
+    "{noun}より{noun2}のほうが好み",
+]
+FILLER_NOUNS = [
+    "友達", "マルチプレイ", "DLC", "コントローラー", "週末", "ボス戦", "探索", "クラフト",
+    "装備", "実績", "協力プレイ", "ランクマッチ", "サーバー", "チュートリアル", "イベント",
+    "キャラクター", "マップ", "武器", "クエスト", "ダンジョン",
+]
+SENTENCE_ENDINGS = ["。", "！", "？"]
+
+def generate_review(rng, aspect_density):
+    sentences = []
+    for _ in range(rng.randint(*SENTENCES_PER_REVIEW)):
+        if rng.random() < aspect_density:
+            aspect = rng.choice(list(fps.ASPECT_EXPRESSIONS))
+            if aspect == "難易度":
+                word = rng.choice(fps.DIFFICULTY_POSITIVE_WORDS + fps.DIFFICULTY_NEGATIVE_WORDS)
+            else:
+                word = rng.choice(fps.POSITIVE_WORDS + fps.NEGATIVE_WORDS)
+            sentence = rng.choice(ASPECT_TEMPLATES).format(
+                aspect=rng.choice(fps.ASPECT_EXPRESSIONS[aspect]), word=word
+            )
+        else:
+            sentence = rng.choice(FILLER_TEMPLATES).format(
+                noun=rng.choice(FILLER_NOUNS), noun2=rng.choice(FILLER_NOUNS), hours=rng.randint(1, 500)
+            )
+        sentences.append(sentence + rng.choice(SENTENCE_ENDINGS))
+    return "".join(sentences)
+
+def generate_corpus(size, aspect_density=DEFAULT_ASPECT_DENSITY, seed=DEFAULT_SEED):
+    # 同じ件数・密度・シードからは常に同じコーパスを生成する
+    rng = random.Random(f"{seed}:{aspect_density}")
+    return [generate_review(rng, aspect_density) for _ in range(size)]
+
+def reset_content_words(analyzed_reviews):
+    # 前の段階で作られた内容語のキャッシュを消し、各段階が同じ状態から始まるようにする
+    for review in analyzed_reviews:
+        for sentence in review.sentences:
+            sentence._content_words = None
+
+def build_stages(corpus):
+    # 各段階は前の段階の結果を入力とする。評価抽出とTF-IDFは、形態素解析の時間を含めないよう
+    # 解析済みのレビューに対して計測する
+    analyzed = [fps.AnalyzedReview(review) for review in corpus]
+    for review in analyzed:
+        review.tokenize()
+    aspect_scores, _ = fps.extract_evaluations(analyzed, fps.ASPECT_EXPRESSIONS)
+
+    def split_sentences():
+        for review in corpus:
+            fps.split_sentences(review)
+
+    def tokenize_japanese():
+        for review in corpus:
+            fps.tokenize_japanese(review)
+
+    def extract_evaluations():
+        reset_content_words(analyzed)
+        fps.extract_evaluations(analyzed, fps.ASPECT_EXPRESSIONS)
+
+    def calculate_sentiment_scores():
+        fps.calculate_sentiment_scores(aspect_scores)
+
+    def generate_word_weights():
+        reset_content_words(analyzed)
+        fps.generate_word_weights(analyzed)
+
+    stages = {
+        'split_sentences': split_sentences,
+        'tokenize_japanese': tokenize_japanese,
+        'extract_evaluations': extract_evaluations,
+        'calculate_sentiment_scores': calculate_sentiment_scores,
+        'generate_word_weights': generate_word_weights,
+    }
+    return [(name, stages[name]) for name in STAGES]
+
+def measure(func, repeat, trace_memory):
+    # 時間は tracemalloc を止めた状態で repeat 回計測した最小値、メモリは別に1回実行して計測する
+    seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if seconds is None or elapsed < seconds:
+            seconds = elapsed
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'seconds': round(seconds, 6), 'peak_bytes': peak}
+
+def run(sizes, aspect_density, seed, repeat, trace_memory):
+    # 辞書の読み込み（Janome・感情辞書）は計測に含めない
+    # Janomeは辞書の一部を初回の解析時に読み込むため、小さいコーパスで一度解析しておく
+    fps.get_tokenizer()
+    fps.get_lexicon()
+    for review in generate_corpus(WARMUP_SIZE, aspect_density, seed):
+        fps.tokenize_japanese(review)
+    results = {}
+    for size in sizes:
+        corpus = generate_corpus(size, aspect_density, seed)
+        results[str(size)] = {}
+        for name, func in build_stages(corpus):
+            result = measure(func, repeat, trace_memory)
+            results[str(size)][name] = result
+            peak = f"{result['peak_bytes'] / 1024 / 1024:.1f}MB" if result['peak_bytes'] is not None else '-'
+            print(f"{size:>7} {name:<28} {result['seconds']:>10.4f}秒 {peak:>10}")
+    return results
+
+def compare(results, baseline, tolerance, memory_tolerance):
+    regressions = []
+    for size, stages in results.items():
+        for name, result in stages.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            limit = base['seconds'] * (1 + tolerance)
+            if result['seconds'] > limit and result['seconds'] - base['seconds'] > MIN_TIME_DIFF:
+                regressions.append(f"{size}件 {name}: {base['seconds']:.4f}秒 -> {result['seconds']:.4f}秒")
+            if result['peak_bytes'] is not None and base.get('peak_bytes') is not None:
+                limit = base['peak_bytes'] * (1 + memory_tolerance)
+                if result['peak_bytes'] > limit and result['peak_bytes'] - base['peak_bytes'] > MIN_MEMORY_DIFF:
+                    regressions.append(
+                        f"{size}件 {name}: {base['peak_bytes']}バイト -> {result['peak_bytes']}バイト"
+                    )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="レビュー解析の各段階の実行時間とピークメモリを計測します。")
+    parser.add_argument('--sizes', type=int, nargs='+', default=None,
+                        help="計測するレビュー数（既定: 基準の結果と同じ件数、基準と比較しない場合は "
+                             f"{' '.join(map(str, DEFAULT_SIZES))}）")
+    parser.add_argument('--aspect-density', type=float, default=DEFAULT_ASPECT_DENSITY,
+                        help="アスペクトの表現を含む文の割合（0〜1）")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="コーパス生成の乱数シード")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="各段階の実行時間を計測する回数（最小値を採用）")
+    parser.add_argument('--no-memory', action='store_true', help="ピークメモリを計測しない")
+    parser.add_argument('--output', help="計測結果を書き出すJSONファイル（基準の結果として使える）")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="比較する基準の結果のJSONファイル")
+    parser.add_argument('--no-baseline', action='store_true', help="基準の結果と比較しない")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="実行時間の許容する増加率")
+    parser.add_argument('--memory-tolerance', type=float, default=DEFAULT_MEMORY_TOLERANCE,
+                        help="ピークメモリの許容する増加率")
+    args = parser.parse_args()
+
+    config = {'aspect_density': args.aspect_density, 'seed': args.seed}
+    baseline = None
+    if not args.no_baseline:
+        try:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"基準の結果 {args.baseline} が見つかりません。--output で作成するか --no-baseline を指定してください。")
+            sys.exit(2)
+        # コーパスが異なると比較にならない
+        if baseline.get('config') != config:
+            print(f"基準の結果とコーパスの設定が異なります: {baseline.get('config')} != {config}")
+            sys.exit(2)
+        if (baseline.get('python'), baseline.get('machine')) != (platform.python_version(), platform.machine()):
+            print(f"注意: 基準の結果は Python {baseline.get('python')} / {baseline.get('machine')} で計測されています。")
+
+    sizes = args.sizes
+    if sizes is None:
+        sizes = [int(size) for size in baseline['results']] if baseline is not None else DEFAULT_SIZES
+    results = run(sizes, args.aspect_density, args.seed, max(1, args.repeat), not args.no_memory)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'config': config,
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"計測結果を {args.output} に保存しました。")
+
+    if baseline is not None:
+        regressions = compare(results, baseline['results'], args.tolerance, args.memory_tolerance)
+        if regressions:
+            print("基準の結果より悪化した段階があります:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("基準の結果からの悪化はありません。")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# レビュー解析1回あたりの形態素解析（Janome）の呼び出し回数を比較するベンチマーク
+#
+# steamディレクトリで実行する:
+#     python benchmarks/tokenizer_calls.py --size 1000
+#     python benchmarks/tokenizer_calls.py --reviews reviews.json
+
+import argparse
+import json
+import os
+import sys
+import time
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(script_dir, os.pardir))
+sys.path.append(parent_dir)
+
+import fetch_and_parse_steam as fps
+
+SAMPLE_REVIEWS = [
+    "グラフィックがとても綺麗で、音楽も素晴らしい。ストーリーは少し単調だった。",
+    "難易度が高くて難しいけど、挑戦的で楽しい！ボス戦のサウンドが最高。",
+    "ロード時間が長いのが不満。バグも多く、動作が不安定です。",
+    "物語の展開がドラマチックで感動的でした。キャラクター開発も丁寧。",
+    "シンプルで簡単な操作。友達と遊ぶと面白い。",
+    "値段の割にボリュームがある。おすすめです。",
+]
+
+class CountingTokenizer:
+    # tokenize() の呼び出し回数を数えるラッパー
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.calls = 0
+
+    def tokenize(self, text, *args, **kwargs):
+        self.calls += 1
+        return self.tokenizer.tokenize(text, *args, **kwargs)
+
+def legacy_tokenizer_calls(reviews, aspects):
+    # 変更前の実装での呼び出し回数
+    # （文ごとにヒットしたアスペクトの数だけ解析し、TF-IDF用にレビュー全体をもう一度解析していた）
+    calls = 0
+    for review in reviews:
+        for sentence in fps.split_sentences(review):
+            for expressions in aspects.values():
+                if any(expr in sentence for expr in expressions):
+                    calls += 1
+        calls += 1
+    return calls
+
+def load_reviews(path, size):
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            reviews = json.load(f)
+    else:
+        reviews = SAMPLE_REVIEWS
+    return [reviews[i % len(reviews)] for i in range(size)]
+
+def main():
+    parser = argparse.ArgumentParser(description="1ゲームあたりの形態素解析の呼び出し回数を計測します。")
+    parser.add_argument('--reviews', help="レビュー本文のJSON配列ファイル（省略時は組み込みのサンプル）")
+    parser.add_argument('--size', type=int, default=100, help="解析するレビュー数")
+    args = parser.parse_args()
+
+    reviews = load_reviews(args.reviews, args.size)
+    legacy_calls = legacy_tokenizer_calls(reviews, fps.ASPECT_EXPRESSIONS)
+
+    # 感情辞書のコンパイルでの呼び出しは計測に含めない
+    fps.get_lexicon()
+    counting = CountingTokenizer(fps.get_tokenizer())
+    fps.tokenizer = counting
+    start = time.perf_counter()
+    accumulator = fps.ReviewAccumulator(fps.ASPECT_EXPRESSIONS)
+    accumulator.add_batch([{'review': review} for review in reviews])
+    accumulator.sentiment_scores()
+    accumulator.word_weights()
+    elapsed = time.perf_counter() - start
+
+    print(f"レビュー数: {len(reviews)}")
+    print(f"変更前の呼び出し回数: {legacy_calls}")
+    print(f"変更後の呼び出し回数: {counting.calls}")
+    if legacy_calls:
+        print(f"削減率: {(1 - counting.calls / legacy_calls) * 100:.1f}%")
+    print(f"解析時間: {elapsed:.3f}秒")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, pool
+
+# プール全体で保持する接続数の上限（同時に接続を借りられるスレッド数）
+POOL_MIN = 1
+POOL_MAX = int(os.getenv('PGPOOL_MAX', '4'))
+# 1つのSQL文に許す実行時間（ミリ秒）
+STATEMENT_TIMEOUT_MS = int(os.getenv('PGSTATEMENT_TIMEOUT_MS', '300000'))
+# この時間以上使われていなかった接続は、貸し出す前に生きているか確認する（秒）
+HEALTH_CHECK_IDLE = 30.0
+
+_params = None
+_pool = None
+_slots = None
+_last_used = {}
+_lock = threading.Lock()
+
+
+def db_params():
+    # PG* の環境変数は最初に使うときに1度だけ読み込む
+    global _params
+    if _params is None:
+        _params = {
+            'host': os.getenv('PGHOST'),
+            'port': os.getenv('PGPORT'),
+            'dbname': os.getenv('PGDATABASE'),
+            'user': os.getenv('PGUSER'),
+            'password': os.getenv('PGPASSWORD'),
+        }
+    return _params
+
+
+def is_configured():
+    return all(db_params().values())
+
+
+def get_pool():
+    global _pool, _slots
+    with _lock:
+        if _pool is None:
+            _pool = pool.ThreadedConnectionPool(
+                POOL_MIN, POOL_MAX,
+                options=f'-c statement_timeout={STATEMENT_TIMEOUT_MS}',
+                **db_params()
+            )
+            # プールが空のときに例外にせず、接続が返されるまで待つ
+            _slots = threading.BoundedSemaphore(POOL_MAX)
+    return _pool
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0.0) < HEALTH_CHECK_IDLE:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def connection():
+    # プールから接続を借りる。コミットは呼び出し側で行い、返す前に未確定の変更は取り消す
+    connection_pool = get_pool()
+    _slots.acquire()
+    conn = None
+    try:
+        conn = connection_pool.getconn()
+        if not _is_healthy(conn):
+            connection_pool.putconn(conn, close=True)
+            conn = connection_pool.getconn()
+        yield conn
+    finally:
+        if conn is not None:
+            broken = conn.closed
+            if not broken and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            _last_used[id(conn)] = time.monotonic()
+            connection_pool.putconn(conn, close=broken)
+        _slots.release()
+
+
+@atexit.register
+def close_all():
+    global _pool
+    with _lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
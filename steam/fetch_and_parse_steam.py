@@ -1,4 +1,3 @@
-import requests
 from janome.tokenizer import Tokenizer
 import re
 import json
@@ -6,8 +5,26 @@ import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 import time
 import os
+import sys
+import argparse
+import itertools
+from collections import Counter, deque
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from tqdm import tqdm
 
+import http_client
+import instrumentation
+from aspect_matcher import AspectMatcher
+from idf_model import IdfModel, document_frequency_delta
+from instrumentation import metrics_path_for
+from json_stream import NdjsonWriter, iter_ndjson
+from lexicon import LEXICON_FORMAT_VERSION, compile_lexicon, load_lexicon_source, merge_sources
+from review_store import ReviewStore
+from run_journal import RunJournal, journal_path_for
+
 POSITIVE_WORDS = [
     "素晴らしい", "最高", "良い", "綺麗", "美しい", "楽しい", "面白い", "満足", "優れている",
     "快適", "魅力的", "感動", "新鮮", "素敵", "便利", "爽快", "明るい", "滑らか", "高品質",
@@ -65,7 +82,26 @@ ASPECT_EXPRESSIONS = {
     ]
 }
 
-tokenizer = Tokenizer()
+# Janomeの辞書の読み込みは重いため、最初に使われたときに（プロセスごとに）生成する
+tokenizer = None
+
+def get_tokenizer():
+    global tokenizer
+    if tokenizer is None:
+        tokenizer = Tokenizer()
+    return tokenizer
+
+ASPECT_MATCHER = AspectMatcher(ASPECT_EXPRESSIONS)
+
+# 並行実行の既定値（ワーカー数）
+# リクエストの間隔は http_client の共有のレート制限（rate_budget.py、環境変数 RATE_BUDGETS）で制御する
+DEFAULT_WORKERS = 4
+
+# 1ゲームあたりに取得するレビューの上限と、1ページあたりの件数（APIの上限は100件）
+REVIEW_BUDGET = 1000
+REVIEWS_PER_PAGE = 100
+# 先読み中の1ゲームあたりに、解析を待たせておくレビューのページ数の上限
+REVIEW_QUEUE_PAGES = 2
 
 # ストップワードリストの読み込み
 def load_stopwords(json_path):
@@ -78,38 +114,128 @@ def load_stopwords(json_path):
         return set()
 
 STOPWORDS_PATH = 'stopwords.json'
-STOPWORDS = load_stopwords(STOPWORDS_PATH)
 
-def fetch_reviews(appid, retries=3, delay=2):
-    url = f"https://store.steampowered.com/appreviews/{appid}?json=1&language=japanese&num_per_page=100&purchase_type=all"
+# 感情辞書の読み込み（組み込みの単語リストに、辞書ファイルのエントリを追加する）
+BUILTIN_LEXICON = {
+    'format_version': LEXICON_FORMAT_VERSION,
+    'version': 'builtin',
+    'sentiment': {'positive': POSITIVE_WORDS, 'negative': NEGATIVE_WORDS},
+    'difficulty': {'difficult': DIFFICULTY_POSITIVE_WORDS, 'easy': DIFFICULTY_NEGATIVE_WORDS},
+    'stopwords': []
+}
+
+def load_lexicon(json_path):
+    try:
+        return merge_sources(BUILTIN_LEXICON, load_lexicon_source(json_path))
+    except Exception as e:
+        print(f"感情辞書の読み込みに失敗しました: {e}")
+        return merge_sources(BUILTIN_LEXICON)
+
+LEXICON_PATH = os.getenv('LEXICON_PATH', 'lexicon.json')
+LEXICON_SOURCE = load_lexicon(LEXICON_PATH)
+STOPWORDS = load_stopwords(STOPWORDS_PATH) | set(LEXICON_SOURCE['stopwords'])
+
+_lexicon = None
+
+def get_lexicon():
+    # 辞書のエントリは解析時と同じ方法で形態素解析するため、初回利用時にコンパイルする
+    global _lexicon
+    if _lexicon is None:
+        _lexicon = compile_lexicon(LEXICON_SOURCE, tokenize_base_forms, STOPWORDS)
+    return _lexicon
+
+def fetch_review_page(appid, params, retries=3, delay=2):
+    url = f"https://store.steampowered.com/appreviews/{appid}"
     for attempt in range(retries):
         try:
-            response = requests.get(url)
+            response = http_client.get(url, params=params)
             if response.status_code != 200:
                 raise Exception(f"HTTPステータスコード {response.status_code}")
-            data = response.json()
-            raw_reviews = data.get("reviews", [])
-            reviews = []
-            playtimes = []
-            for review in raw_reviews:
-                review_text = review.get("review", "")
-                playtime = review.get("author", {}).get("playtime_forever", 0)  # 分単位
-                reviews.append(review_text)
-                playtimes.append(playtime)
-            return reviews, playtimes
+            return response.json()
         except Exception as e:
             print(f"appid {appid} のレビュー取得に失敗しました (試行 {attempt + 1}/{retries}): {e}")
             time.sleep(delay)
     print(f"appid {appid} のレビュー取得に全て失敗しました。スキップします。")
-    return [], []
+    return None
 
-def tokenize_japanese(text):
-    tokens = []
-    for token in tokenizer.tokenize(text):
-        pos = token.part_of_speech.split(',')[0]
+def iter_review_batches(appid, max_reviews=REVIEW_BUDGET, retries=3, delay=2, review_filter='all'):
+    # cursorを辿りながら、レビュー上限に達するまでページ単位でレビューを返す
+    # 'all' は参考になった順、'recent' は新しい順（レビューストアの差分取得は新しい順が前提）
+    params = {
+        'json': 1,
+        'language': 'japanese',
+        'num_per_page': REVIEWS_PER_PAGE,
+        'purchase_type': 'all',
+        'filter': review_filter,
+        'cursor': '*'
+    }
+    fetched = 0
+    seen_cursors = set()
+    while fetched < max_reviews:
+        params['num_per_page'] = min(REVIEWS_PER_PAGE, max_reviews - fetched)
+        with instrumentation.stage('fetch_reviews'):
+            data = fetch_review_page(appid, params, retries=retries, delay=delay)
+        if data is None:
+            return
+        raw_reviews = data.get("reviews", [])
+        if not raw_reviews:
+            return
+        fetched += len(raw_reviews)
+        instrumentation.increment('reviews_fetched', len(raw_reviews))
+        yield raw_reviews
+        # 最終ページでは同じcursorが返されるため、既出のcursorで打ち切る
+        cursor = data.get("cursor")
+        if not cursor or cursor in seen_cursors:
+            return
+        seen_cursors.add(cursor)
+        params['cursor'] = cursor
+
+def review_texts_and_playtimes(raw_reviews):
+    reviews = []
+    playtimes = []
+    for review in raw_reviews:
+        review_text = review.get("review", "")
+        playtime = review.get("author", {}).get("playtime_forever", 0)  # 分単位
+        reviews.append(review_text)
+        playtimes.append(playtime)
+    return reviews, playtimes
+
+def sync_reviews(appid, store, max_reviews=REVIEW_BUDGET):
+    # 保存済みの最新レビュー（ハイウォーターマーク）より新しいものだけを新しい順に取得して保存する
+    high_water = store.high_water(appid)
+    added = 0
+    for raw_reviews in iter_review_batches(appid, max_reviews=max_reviews, review_filter='recent'):
+        if high_water is None:
+            added += store.add_reviews(appid, raw_reviews)
+            continue
+        # 同じ作成時刻のレビューは取りこぼさないよう含めておき、重複はキーで吸収する
+        new_reviews = [review for review in raw_reviews if review.get('timestamp_created', 0) >= high_water]
+        added += store.add_reviews(appid, new_reviews)
+        if len(new_reviews) < len(raw_reviews):
+            break
+    return added
+
+def fetch_reviews(appid, retries=3, delay=2, max_reviews=REVIEW_BUDGET):
+    reviews = []
+    playtimes = []
+    for raw_reviews in iter_review_batches(appid, max_reviews=max_reviews, retries=retries, delay=delay):
+        batch_reviews, batch_playtimes = review_texts_and_playtimes(raw_reviews)
+        reviews.extend(batch_reviews)
+        playtimes.extend(batch_playtimes)
+    return reviews, playtimes
+
+def analyze_tokens(text):
+    # 形態素解析の結果を（原形, 品詞）の組として保持する
+    with instrumentation.stage('tokenize'):
+        tokens = [(token.base_form, token.part_of_speech.split(',')[0]) for token in get_tokenizer().tokenize(text)]
+    instrumentation.increment('tokens', len(tokens))
+    return tokens
+
+def filter_content_words(tokens):
+    words = []
+    for word, pos in tokens:
         # 名詞、形容詞、動詞のみを対象
         if pos in ['名詞', '形容詞', '動詞']:
-            word = token.base_form
             # 数値のみの単語を除外
             if re.match(r'^\d+$', word):
                 continue
@@ -119,8 +245,15 @@ def tokenize_japanese(text):
             # ストップワードを除外
             if word in STOPWORDS:
                 continue
-            tokens.append(word)
-    return tokens
+            words.append(word)
+    return words
+
+def tokenize_japanese(text):
+    return filter_content_words(analyze_tokens(text))
+
+def tokenize_base_forms(text):
+    # 品詞やストップワードで絞り込まない原形の列（感情辞書の表現の照合に使う）
+    return [word for word, pos in analyze_tokens(text)]
 
 def split_sentences(text):
     # 日本語の文の区切り文字を正規表現で分割
@@ -129,57 +262,146 @@ def split_sentences(text):
     sentences = [sentence.strip() for sentence in sentences if sentence.strip()]
     return sentences
 
-def extract_evaluations(reviews, aspects, window_size=5):
-    # 初期化
-    aspect_scores = {aspect: {'ポジティブ': 0, 'ネガティブ': 0} for aspect in aspects}
-    aspect_scores["難易度"] = {'難しい': 0, '簡単': 0}  # 難易度専用
+class AnalyzedSentence:
+    # 1文分の解析結果（本文中の位置と、その範囲に含まれる（原形, 品詞）の組）
+    __slots__ = ('review', 'text', 'start', 'end', '_tokens', '_content_words')
+
+    def __init__(self, review, text, start):
+        self.review = review
+        self.text = text
+        self.start = start
+        self.end = start + len(text)
+        self._tokens = None
+        self._content_words = None
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            self.review.tokenize()
+        return self._tokens
+
+    @property
+    def content_words(self):
+        if self._content_words is None:
+            self._content_words = filter_content_words(self.tokens)
+        return self._content_words
+
+    @property
+    def base_forms(self):
+        return [word for word, pos in self.tokens]
+
+class AnalyzedReview:
+    # レビュー1件を文に分割したもの。形態素解析はレビュー全体に対して一度だけ行い、
+    # 得られたトークンを文字位置で各文に振り分ける
+    __slots__ = ('text', 'sentences', 'tokenized')
+
+    def __init__(self, text):
+        self.text = text
+        self.tokenized = False
+        # split_sentences と同じ区切り方で、各文の本文中の位置も保持する
+        self.sentences = []
+        for match in re.finditer(r'[^。！？]+', text):
+            raw = match.group()
+            sentence = raw.strip()
+            if not sentence:
+                continue
+            start = match.start() + (len(raw) - len(raw.lstrip()))
+            self.sentences.append(AnalyzedSentence(self, sentence, start))
+
+    def tokenize(self):
+        if self.tokenized:
+            return
+        self.tokenized = True
+        sentences = self.sentences
+        for sentence in sentences:
+            sentence._tokens = []
+        if not sentences:
+            return
+        with instrumentation.stage('tokenize'):
+            count = self._assign_tokens(sentences)
+        instrumentation.increment('tokens', count)
+
+    def _assign_tokens(self, sentences):
+        index = 0
+        offset = 0
+        count = 0
+        for token in get_tokenizer().tokenize(self.text):
+            count += 1
+            surface = token.surface
+            start = self.text.find(surface, offset)
+            if start < 0:
+                start = offset
+            offset = start + len(surface)
+            # トークンの開始位置を含む文に割り当てる（区切り文字や文間の空白は除外）
+            while index < len(sentences) and sentences[index].end <= start:
+                index += 1
+            if index == len(sentences):
+                break
+            if sentences[index].start <= start:
+                sentences[index]._tokens.append((token.base_form, token.part_of_speech.split(',')[0]))
+        return count
+
+    def content_words(self):
+        words = []
+        for sentence in self.sentences:
+            words.extend(sentence.content_words)
+        return words
+
+def analyze_review(review):
+    if isinstance(review, AnalyzedReview):
+        return review
+    return AnalyzedReview(review)
+
+def get_aspect_matcher(aspects):
+    # 標準のアスペクト辞書はモジュール読み込み時にコンパイルしたものを使い回す
+    if aspects is ASPECT_EXPRESSIONS:
+        return ASPECT_MATCHER
+    return AspectMatcher(aspects)
+
+def extract_evaluations(reviews, aspects, window_size=5, aspect_scores=None, word_weights=None):
+    # 初期化（途中までの集計結果が渡された場合はそこに加算する）
+    if aspect_scores is None:
+        aspect_scores = {aspect: {'ポジティブ': 0, 'ネガティブ': 0} for aspect in aspects}
+        aspect_scores["難易度"] = {'難しい': 0, '簡単': 0}  # 難易度専用
 
     # Word weightの初期化
-    word_weights = {aspect: {} for aspect in aspects}
-    word_weights["難易度"] = {}  # 難易度専用
+    if word_weights is None:
+        word_weights = {aspect: {} for aspect in aspects}
+        word_weights["難易度"] = {}  # 難易度専用
+
+    matcher = get_aspect_matcher(aspects)
+    lexicon = get_lexicon()
 
     for review in reviews:
-        sentences = split_sentences(review)
-        for sentence in sentences:
-            for aspect, expressions in aspects.items():
+        for analyzed_sentence in analyze_review(review).sentences:
+            # 1回の走査でヒットしたアスペクトを求め、何もヒットしない文は形態素解析しない
+            hits = matcher.match(analyzed_sentence.text)
+            if not hits:
+                continue
+            tokens = analyzed_sentence.content_words
+            # 感情辞書は「低品質」→（低, 品質）のように絞り込まない原形の列で登録しているため、
+            # 文の側も絞り込まない原形の列で照合する
+            base_forms = analyzed_sentence.base_forms
+            for aspect in aspects:
+                if aspect not in hits:
+                    continue
                 if aspect == "難易度":
                     # 「難易度」が含まれる文、または「難しい」「簡単」などが含まれる文
-                    if any(expr in sentence for expr in expressions):
-                        tokens = tokenize_japanese(sentence)
-                        # 難易度に関連する単語をカウント
-                        for word in tokens:
-                            if word in DIFFICULTY_POSITIVE_WORDS:
-                                aspect_scores[aspect]['難しい'] += 1
-                                word_weights[aspect][word] = word_weights[aspect].get(word, 0) + 1
-                            elif word in DIFFICULTY_NEGATIVE_WORDS:
-                                aspect_scores[aspect]['簡単'] += 1
-                                word_weights[aspect][word] = word_weights[aspect].get(word, 0) + 1
+                    # 難易度に関連する単語・表現をカウント
+                    matches = lexicon.difficulty.match(base_forms)
                 elif aspect == "ストーリー性":
                     # ストーリー性に関連する表現が含まれる文
-                    if any(expr in sentence for expr in expressions):
-                        tokens = tokenize_japanese(sentence)
-                        # ストーリー性に関連する単語をカウント
-                        for word in tokens:
-                            # ストーリー性の評価は感情辞書を使用
-                            if word in POSITIVE_WORDS:
-                                aspect_scores[aspect]['ポジティブ'] += 1
-                                word_weights[aspect][word] = word_weights[aspect].get(word, 0) + 1
-                            elif word in NEGATIVE_WORDS:
-                                aspect_scores[aspect]['ネガティブ'] += 1
-                                word_weights[aspect][word] = word_weights[aspect].get(word, 0) + 1
+                    # ストーリー性の評価は感情辞書を使用
+                    matches = lexicon.sentiment.match(base_forms)
                 else:
                     # その他のアスペクト（グラフィック、音楽）について
-                    if any(expr in sentence for expr in expressions):
-                        tokens = tokenize_japanese(sentence)
-                        # アスペクトに関連する単語を検出
-                        if any(expr in tokens for expr in expressions):
-                            for word in tokens:
-                                if word in POSITIVE_WORDS:
-                                    aspect_scores[aspect]['ポジティブ'] += 1
-                                    word_weights[aspect][word] = word_weights[aspect].get(word, 0) + 1
-                                elif word in NEGATIVE_WORDS:
-                                    aspect_scores[aspect]['ネガティブ'] += 1
-                                    word_weights[aspect][word] = word_weights[aspect].get(word, 0) + 1
+                    # アスペクトに関連する単語を検出
+                    if not matcher.tokens_hit(aspect, tokens):
+                        continue
+                    matches = lexicon.sentiment.match(base_forms)
+                for label, entry in matches:
+                    aspect_scores[aspect][label] += 1
+                    word_weights[aspect][entry] = word_weights[aspect].get(entry, 0) + 1
     return aspect_scores, word_weights
 
 def calculate_sentiment_scores(aspect_scores):
@@ -222,47 +444,47 @@ def calculate_sentiment_scores(aspect_scores):
             sentiment_scores[aspect] = difficulty_score
     return sentiment_scores
 
-def generate_word_weights(reviews, top_percent=25, decimal_places=2):
+def generate_word_weights(reviews, top_percent=25, decimal_places=2, max_features=None, idf_model=None):
     # トークン化したレビュー文をスペースで結合（TF-IDF Vectorizerの入力形式に合わせる）
-    tokenized_reviews = [" ".join(tokenize_japanese(review)) for review in reviews]
-    
+    tokenized_reviews = [" ".join(analyze_review(review).content_words()) for review in reviews]
+    return compute_word_weights(tokenized_reviews, top_percent=top_percent, decimal_places=decimal_places,
+                                max_features=max_features, idf_model=idf_model)
+
+def select_top_k(values, indices, k):
+    # values[indices] のうち上位k件のインデックスを、重みの降順（同じ重みは元の順序）で返す
+    candidate_values = values[indices]
+    if k < candidate_values.size:
+        # 全体をソートせず、k番目に大きい重みだけを argpartition で求める
+        kth = candidate_values[np.argpartition(-candidate_values, k - 1)[k - 1]]
+        greater = indices[candidate_values > kth]
+        equal = indices[candidate_values == kth][:k - greater.size]
+        indices = np.concatenate([greater, equal])
+    order = np.lexsort((indices, -values[indices]))
+    return indices[order]
+
+def compute_word_weights(tokenized_reviews, top_percent=25, decimal_places=2, max_features=None, idf_model=None):
     # トークン化後のデータが空でないか確認
     if not any(tokenized_reviews):
         print("トークン化後のレビューが全て空です。TF-IDF計算をスキップします。")
         return {}
     
     try:
-        # TF-IDFベクトル化
-        vectorizer = TfidfVectorizer(tokenizer=lambda x: x.split(), token_pattern=None)
-        tfidf_matrix = vectorizer.fit_transform(tokenized_reviews)
-        
-        # ボキャブラリーの取得
-        feature_names = vectorizer.get_feature_names_out()
-        
-        # 各単語とその重みの合計を計算
-        word_weights = np.sum(tfidf_matrix.toarray(), axis=0)
+        if idf_model is not None:
+            # 全ゲームで学習済みのIDFを使い、このゲームのレビューでは再学習しない
+            feature_names, word_weights = idf_model.weigh(tokenized_reviews, max_features=max_features)
+        else:
+            # TF-IDFベクトル化（max_featuresを指定した場合は出現頻度の高い語彙に制限する）
+            vectorizer = TfidfVectorizer(tokenizer=lambda x: x.split(), token_pattern=None, max_features=max_features)
+            tfidf_matrix = vectorizer.fit_transform(tokenized_reviews)
 
-        # 単語とその重みの辞書を作成（1文字以下の単語を除外）
-        word_weight_dict = {k: v for k, v in zip(feature_names, word_weights) if len(k) > 1}
-        
-        if not word_weight_dict:
-            print("有効な単語が存在しません。TF-IDF計算をスキップします。")
-            return {}
-        
-        # 単語の重みを降順にソート
-        sorted_words = sorted(word_weight_dict.items(), key=lambda item: item[1], reverse=True)
-        
-        # 上位25%の単語数を計算
-        top_n = max(int(len(sorted_words) * (top_percent / 100)), 1)  # 少なくとも1単語を保持
-        top_words = sorted_words[:top_n]
-        
-        # 上位25%の単語のみを保持
-        top_word_weight_dict = dict(top_words)
+            # ボキャブラリーの取得
+            feature_names = vectorizer.get_feature_names_out()
 
-        # 小数点以下を指定桁数に丸める
-        top_word_weight_dict = {k: round(v, decimal_places) for k, v in top_word_weight_dict.items()}
-        
-        return top_word_weight_dict
+            # 各単語とその重みの合計を計算（疎行列のまま列ごとに合計する）
+            word_weights = np.asarray(tfidf_matrix.sum(axis=0)).ravel()
+
+        return select_word_weights(feature_names, word_weights, top_percent=top_percent,
+                                   decimal_places=decimal_places)
     
     except ValueError as ve:
         print(f"TF-IDF計算中にエラーが発生しました: {ve}")
@@ -271,14 +493,198 @@ def generate_word_weights(reviews, top_percent=25, decimal_places=2):
         print(f"予期せぬエラーが発生しました: {e}")
         return {}
 
+def select_word_weights(feature_names, word_weights, top_percent=25, decimal_places=2):
+    # 1文字以下の単語を除外
+    candidates = np.flatnonzero(np.char.str_len(feature_names.astype(str)) > 1)
+    
+    if candidates.size == 0:
+        print("有効な単語が存在しません。TF-IDF計算をスキップします。")
+        return {}
+    
+    # 上位25%の単語数を計算
+    top_n = max(int(candidates.size * (top_percent / 100)), 1)  # 少なくとも1単語を保持
+    
+    # 上位25%の単語のみを重みの降順で保持し、小数点以下を指定桁数に丸める
+    top_indices = select_top_k(word_weights, candidates, top_n)
+    return {feature_names[i]: round(word_weights[i], decimal_places) for i in top_indices}
+
 def calculate_average_play_time(playtimes):
-    if not playtimes:
+    # リストに限らず、ジェネレーターなども逐次的に集計できるようにする
+    total_minutes = 0
+    count = 0
+    for playtime in playtimes:
+        total_minutes += playtime
+        count += 1
+    return average_play_time_hours(total_minutes, count)
+
+def average_play_time_hours(total_minutes, count):
+    if not count:
         return 0  # データがない場合は0を返す
-    average_minutes = sum(playtimes) / len(playtimes)
+    average_minutes = total_minutes / count
     average_hours = int(average_minutes // 60)  # 小数点以下を切り捨て
     return average_hours
 
-def parse_steam_details(steam_id, twitch_id, additional_data):
+class ReviewAccumulator:
+    # レビューをバッチ単位で受け取り、スコアの算出に必要な集計値だけを保持する
+    # （レビュー本文はバッチの処理後に破棄される）
+    # 全ゲーム共通のIDFを使い語彙数の上限もない場合は、レビューごとの重みが他のレビューに依存しないため
+    # バッチごとに単語の重みを合計してトークン列を残さない。それ以外はゲームのレビュー全体でTF-IDFを
+    # 学習するため、TF-IDF用のトークン列だけを残す
+    def __init__(self, aspects, max_features=None, idf_model=None):
+        self.aspects = aspects
+        self.max_features = max_features
+        self.idf_model = idf_model
+        # IDFモデルに未集計のレビューの文書頻度（実行の最後にモデルへ反映する）
+        self.document_frequencies = Counter()
+        self.new_review_ids = []
+        self.aspect_scores = None
+        self.aspect_word_weights = None
+        self.tokenized_reviews = []
+        self.weight_totals = {} if idf_model is not None and max_features is None else None
+        self.playtime_total = 0
+        self.review_count = 0
+
+    def add_batch(self, raw_reviews):
+        reviews, playtimes = review_texts_and_playtimes(raw_reviews)
+        review_ids = [review.get("recommendationid") for review in raw_reviews]
+        self.add_reviews(reviews, playtimes, review_ids)
+
+    def add_reviews(self, reviews, playtimes, review_ids=None):
+        # 各レビューは一度だけ文分割・形態素解析し、評価抽出とTF-IDFで共有する
+        analyzed_reviews = [AnalyzedReview(review) for review in reviews]
+        # 形態素解析は評価抽出の中で必要になったときに行われるため、この段階の時間は tokenize を含む
+        with instrumentation.stage('extract_evaluations'):
+            self.aspect_scores, self.aspect_word_weights = extract_evaluations(
+                analyzed_reviews, self.aspects, window_size=5,
+                aspect_scores=self.aspect_scores, word_weights=self.aspect_word_weights
+            )
+        tokenized_reviews = [" ".join(review.content_words()) for review in analyzed_reviews]
+        if self.weight_totals is not None:
+            self.add_word_weights(tokenized_reviews)
+        else:
+            self.tokenized_reviews.extend(tokenized_reviews)
+        self.playtime_total += sum(playtimes)
+        self.review_count += len(reviews)
+        if self.idf_model is not None and review_ids is not None:
+            self.track_new_documents(tokenized_reviews, review_ids)
+
+    def add_word_weights(self, tokenized_reviews):
+        if not any(tokenized_reviews):
+            return
+        with instrumentation.stage('tfidf'):
+            feature_names, word_weights = self.idf_model.weigh(tokenized_reviews)
+        for term, weight in zip(feature_names, word_weights):
+            term = str(term)
+            self.weight_totals[term] = self.weight_totals.get(term, 0.0) + weight
+
+    def track_new_documents(self, tokenized_reviews, review_ids):
+        # IDFモデルにまだ集計されていないレビューだけを文書頻度の更新対象にする
+        pairs = [(review, int(review_id)) for review, review_id in zip(tokenized_reviews, review_ids)
+                 if review_id is not None]
+        if not pairs:
+            return
+        seen = self.idf_model.is_seen([review_id for _, review_id in pairs])
+        new_pairs = [pair for pair, is_seen in zip(pairs, seen) if not is_seen]
+        self.document_frequencies.update(document_frequency_delta(review for review, _ in new_pairs))
+        self.new_review_ids.extend(review_id for _, review_id in new_pairs)
+
+    def sentiment_scores(self):
+        if self.aspect_scores is None:
+            self.aspect_scores, self.aspect_word_weights = extract_evaluations([], self.aspects, window_size=5)
+        return calculate_sentiment_scores(self.aspect_scores)
+
+    def word_weights(self, top_percent=25, decimal_places=2):
+        if self.weight_totals is not None:
+            if not self.weight_totals:
+                print("トークン化後のレビューが全て空です。TF-IDF計算をスキップします。")
+                return {}
+            # CountVectorizer と同じく単語の辞書順に並べ、同じ重みの単語の順序をそろえる
+            feature_names = np.array(sorted(self.weight_totals))
+            word_weights = np.array([self.weight_totals[term] for term in feature_names])
+            return select_word_weights(feature_names, word_weights, top_percent=top_percent,
+                                       decimal_places=decimal_places)
+        with instrumentation.stage('tfidf'):
+            return compute_word_weights(self.tokenized_reviews, top_percent=top_percent,
+                                        decimal_places=decimal_places, max_features=self.max_features,
+                                        idf_model=self.idf_model)
+
+    def play_time_hours(self):
+        return average_play_time_hours(self.playtime_total, self.review_count)
+
+    def partial(self):
+        # ワーカープロセスで解析したバッチの途中の集計値（親プロセスで merge により合算する）
+        return {
+            'aspect_scores': self.aspect_scores,
+            'aspect_word_weights': self.aspect_word_weights,
+            'tokenized_reviews': self.tokenized_reviews,
+            'weight_totals': self.weight_totals,
+            'playtime_total': self.playtime_total,
+            'review_count': self.review_count,
+            'document_frequencies': dict(self.document_frequencies),
+            'new_review_ids': self.new_review_ids
+        }
+
+    def merge(self, partial):
+        if partial['aspect_scores'] is not None:
+            if self.aspect_scores is None:
+                self.aspect_scores, self.aspect_word_weights = extract_evaluations([], self.aspects, window_size=5)
+            for totals, other in ((self.aspect_scores, partial['aspect_scores']),
+                                  (self.aspect_word_weights, partial['aspect_word_weights'])):
+                for aspect, counts in other.items():
+                    for key, count in counts.items():
+                        totals[aspect][key] = totals[aspect].get(key, 0) + count
+        self.tokenized_reviews.extend(partial['tokenized_reviews'])
+        if self.weight_totals is not None and partial['weight_totals']:
+            for term, weight in partial['weight_totals'].items():
+                self.weight_totals[term] = self.weight_totals.get(term, 0.0) + weight
+        self.playtime_total += partial['playtime_total']
+        self.review_count += partial['review_count']
+        self.document_frequencies.update(partial['document_frequencies'])
+        self.new_review_ids.extend(partial['new_review_ids'])
+
+    def summary(self):
+        # プロセス間で受け渡せるよう、集計結果だけをまとめた辞書を返す
+        return {
+            'review_count': self.review_count,
+            'sentiment_scores': self.sentiment_scores(),
+            'word_weights': self.word_weights(top_percent=25, decimal_places=2),
+            'play_time': self.play_time_hours(),
+            'document_frequencies': dict(self.document_frequencies),
+            'new_review_ids': self.new_review_ids
+        }
+
+def analyze_review_batches(review_batches, max_features=None, idf_model=None):
+    # レビューをページごとに受け取り、逐次的に集計する
+    accumulator = ReviewAccumulator(ASPECT_EXPRESSIONS, max_features=max_features, idf_model=idf_model)
+    for raw_reviews in review_batches:
+        accumulator.add_batch(raw_reviews)
+    return accumulator.summary()
+
+def analyze_review_batch(reviews, playtimes, review_ids=None, max_features=None):
+    # ワーカープロセスで実行される1ページ分の解析処理（本文とプレイ時間、レビューIDだけを受け取る）
+    accumulator = ReviewAccumulator(ASPECT_EXPRESSIONS, max_features=max_features, idf_model=worker_idf_model)
+    accumulator.add_reviews(reviews, playtimes, review_ids)
+    partial = accumulator.partial()
+    # ワーカープロセスで計測した分は、結果と一緒に親プロセスへ返して合算する
+    partial['metrics'] = instrumentation.get_metrics().drain()
+    return partial
+
+worker_idf_model = None
+
+def init_nlp_worker(idf_model=None, trace_memory=False):
+    # ワーカープロセスごとに一度だけTokenizerと感情辞書、IDFモデルを用意する
+    global worker_idf_model
+    worker_idf_model = idf_model
+    if trace_memory:
+        instrumentation.get_metrics().enable_memory_tracing()
+    get_tokenizer()
+    get_lexicon()
+
+def stage_idf_update(idf_model, analysis):
+    if idf_model is not None:
+        idf_model.stage(analysis['document_frequencies'], analysis['new_review_ids'])
+
+def fetch_steam_details(steam_id):
     steam_headers = {
         'Accept-Language': 'ja'
     }
@@ -286,7 +692,8 @@ def parse_steam_details(steam_id, twitch_id, additional_data):
     steam_url = f'https://store.steampowered.com/api/appdetails?appids={steam_id}&cc=jp&l=japanese'
 
     try:
-        response = requests.get(steam_url, headers=steam_headers)
+        with instrumentation.stage('fetch_steam_details'):
+            response = http_client.get(steam_url, headers=steam_headers)
         if response.status_code != 200:
             print(f"Steam APIのリクエストに失敗しました。ステータスコード: {response.status_code}")
             return None
@@ -303,6 +710,40 @@ def parse_steam_details(steam_id, twitch_id, additional_data):
         print(f"Steam ID {steam_id} のデータ取得に失敗しました。")
         return None
 
+    return game_data
+
+def fetch_usertags(steam_id):
+    # タグの取得（外部APIを使用）
+    tag_res_url = f"https://steam-active-scrape.netlify.app/.netlify/functions/usertags?gameId={steam_id}"
+
+    try:
+        with instrumentation.stage('fetch_usertags'):
+            tag_res = http_client.get(tag_res_url)
+        if tag_res.status_code == 200:
+            try:
+                tags = tag_res.json().get('tags', [])
+            except json.JSONDecodeError:
+                print(f"タグ取得時に無効なJSONが返されました。Steam ID: {steam_id}")
+                print(f"レスポンス内容: {tag_res.text}")
+                tags = []
+        else:
+            print(f"タグ取得リクエストに失敗しました。ステータスコード: {tag_res.status_code}")
+            tags = []
+    except Exception as e:
+        print(f"タグ取得中にエラーが発生しました: {e}")
+        tags = []
+
+    return tags
+
+def parse_steam_details(steam_id, twitch_id, additional_data, game_data=None, tags=None):
+    # 先読み済みのデータが渡されていない場合はここで取得する
+    if game_data is None:
+        game_data = fetch_steam_details(steam_id)
+        if game_data is None:
+            return None
+    if tags is None:
+        tags = fetch_usertags(steam_id)
+
     # 必要な情報の抽出
     game_title = game_data.get('name', "")
     genres = game_data.get('genres', [])
@@ -328,25 +769,6 @@ def parse_steam_details(steam_id, twitch_id, additional_data):
     short_details = game_data.get('short_description', "")
     release_date = game_data.get('release_date', {}).get('date', "")
 
-    # タグの取得（外部APIを使用）
-    tag_res_url = f"https://steam-active-scrape.netlify.app/.netlify/functions/usertags?gameId={steam_id}"
-
-    try:
-        tag_res = requests.get(tag_res_url)
-        if tag_res.status_code == 200:
-            try:
-                tags = tag_res.json().get('tags', [])
-            except json.JSONDecodeError:
-                print(f"タグ取得時に無効なJSONが返されました。Steam ID: {steam_id}")
-                print(f"レスポンス内容: {tag_res.text}")
-                tags = []
-        else:
-            print(f"タグ取得リクエストに失敗しました。ステータスコード: {tag_res.status_code}")
-            tags = []
-    except Exception as e:
-        print(f"タグ取得中にエラーが発生しました: {e}")
-        tags = []
-
     # 追加データの取得
     additional = additional_data.get(str(steam_id), {})
     play_time = additional.get('play_time', 0)
@@ -390,115 +812,425 @@ def parse_steam_details(steam_id, twitch_id, additional_data):
 
     return result
 
-def main():
-    # top_games_data.jsonからデータを読み込む
-    try:
-        with open('top_games_data.json', 'r', encoding='utf-8') as f:
-            top_games_data = json.load(f)
-        if not isinstance(top_games_data, dict):
-            print("top_games_data.jsonの形式が正しくありません。")
-            return
-        print(f"読み込んだゲームの数: {len(top_games_data)}")
-    except Exception as e:
-        print(f"top_games_data.jsonの読み込みに失敗しました: {e}")
-        return
+class ReviewBatchQueue:
+    # 別スレッドで取得したレビューのページを、有界のキューを通して解析する側へ1ページずつ渡す
+    # キューが一杯の間は取得を止めるため、先読み中のゲームが持つのは REVIEW_QUEUE_PAGES ページまでになる
+    END = object()
 
-    # 出力ファイルのパスをスクリプトと同ディレクトリに設定
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    output_file = os.path.join(script_dir, 'all_top_games_data.json')
+    def __init__(self, review_batches, maxsize=REVIEW_QUEUE_PAGES):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.abandoned = threading.Event()
+        threading.Thread(target=self.fill, args=(review_batches,), daemon=True).start()
 
-    # 結果を格納するリスト
-    all_data = []
+    def put(self, item):
+        # 解析する側が読み出しをやめた場合は、待つのをやめて取得を打ち切る
+        while not self.abandoned.is_set():
+            try:
+                self.queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
-    # 各ゲームについて処理
-    for steam_id, game in tqdm(top_games_data.items(), total=len(top_games_data), desc="Processing games"):
-        twitch_id = game.get('twitch_id')
-        game_title = game.get('game_title')
-        total_views = game.get('total_views', 0)
-        active_user = game.get('active_user', 0)
-        active_chat_user = game.get('active_chat_user', 0)
-
-        # Steam IDの存在確認
-        if not steam_id:
-            print(f"Steam IDが存在しないゲーム: {game_title}. スキップします。")
-            continue
+    def fill(self, review_batches):
+        try:
+            for raw_reviews in review_batches:
+                if not self.put(raw_reviews):
+                    return
+        except Exception as e:
+            print(f"レビューの取得中にエラーが発生しました: {e}")
+        finally:
+            self.put(self.END)
+
+    def __iter__(self):
+        try:
+            while True:
+                raw_reviews = self.queue.get()
+                if raw_reviews is self.END:
+                    return
+                yield raw_reviews
+        finally:
+            self.abandoned.set()
 
-        # レビューの取得
-        reviews, playtimes = fetch_reviews(steam_id)
+def fetch_game_resources(steam_id, max_reviews=REVIEW_BUDGET, review_store=None, offline=False):
+    # HTTP通信をまとめて行う（ワーカースレッドで実行される）
+    # レビューはページのイテレーターとして返し、解析する側で1ページずつ集計して破棄する
+    game_data = fetch_steam_details(steam_id)
+    # 詳細が取得できなかったゲームは出力されないため、タグやレビューも取得しない
+    if game_data is None:
+        return [], None, []
+    tags = fetch_usertags(steam_id)
+    if review_store is not None:
+        # 新着レビューだけをストアに取り込み、解析はストアから読み出したレビューで行う
+        # （差分取得のため新しい順に取得するので、解析するのは参考になった順ではなく新しい順のレビューになる）
+        if not offline:
+            sync_reviews(steam_id, review_store, max_reviews=max_reviews)
+        return review_store.iter_review_batches(steam_id, max_reviews), game_data, tags
+    # ページの取得は別スレッドで続け、メインスレッドは解析の合間に通信を待たない
+    return ReviewBatchQueue(iter_review_batches(steam_id, max_reviews=max_reviews)), game_data, tags
 
-        if not reviews:
-            print(f"appid {steam_id} のレビューが取得できませんでした。スキップします。")
-            reviews = []
-            playtimes = []
+def iter_prefetched(func, items, workers, prefetch=None):
+    # 入力順を保ったまま、後続の要素をスレッドプールで先読みしながら結果を返す
+    if prefetch is None:
+        prefetch = workers * 2
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in itertools.islice(items, max(prefetch, 1)):
+            pending.append((item, executor.submit(func, item)))
+        while pending:
+            item, future = pending.popleft()
+            for next_item in itertools.islice(items, 1):
+                pending.append((next_item, executor.submit(func, next_item)))
+            yield item, future.result()
 
-        # アスペクトに関連する評価の抽出とword_weightの収集
-        aspect_scores, word_weights = extract_evaluations(reviews, ASPECT_EXPRESSIONS, window_size=5)
+def enrich_game(steam_id, game, resources, max_features=None, idf_model=None):
+    review_batches, game_data, tags = resources
 
-        # 感情スコアの計算
-        sentiment_scores = calculate_sentiment_scores(aspect_scores)
+    # 詳細が取得できなかったゲームは解析せずにスキップ
+    if game_data is None:
+        return None
 
-        # Word Weightsの計算
-        word_weight_dict = generate_word_weights(reviews, top_percent=25, decimal_places=2)
+    analysis = analyze_review_batches(review_batches, max_features=max_features, idf_model=idf_model)
+    stage_idf_update(idf_model, analysis)
+    return build_enriched_game(steam_id, game, game_data, tags, analysis)
 
-        # 平均プレイ時間の計算（時間単位、整数値、切り捨て）
-        play_time_hours = calculate_average_play_time(playtimes)
+def build_enriched_game(steam_id, game, game_data, tags, analysis):
+    twitch_id = game.get('twitch_id')
+    game_title = game.get('game_title')
+    total_views = game.get('total_views', 0)
+    active_user = game.get('active_user', 0)
+    active_chat_user = game.get('active_chat_user', 0)
 
-        # Steamアクティビティデータを取得（すでにtop_games_data.jsonに含まれているが、念のため）
-        activity_data = {
-            'active_user': active_user,
-            'active_chat_user': active_chat_user
-        }
+    if not analysis['review_count']:
+        print(f"appid {steam_id} のレビューが取得できませんでした。スキップします。")
 
-        # ゲーム詳細情報の取得と統合
+    # 感情スコア、Word Weights、平均プレイ時間（時間単位、整数値、切り捨て）
+    sentiment_scores = analysis['sentiment_scores']
+    word_weight_dict = analysis['word_weights']
+    play_time_hours = analysis['play_time']
+
+    # Steamアクティビティデータを取得（すでにtop_games_data.jsonに含まれているが、念のため）
+    activity_data = {
+        'active_user': active_user,
+        'active_chat_user': active_chat_user
+    }
+
+    # ゲーム詳細情報の取得と統合
+    with instrumentation.stage('parse_steam_details'):
         game_info = parse_steam_details(steam_id, twitch_id, {
             str(steam_id): {
                 "play_time": play_time_hours,
                 "sentiment_scores": sentiment_scores,
                 "word_weights": word_weight_dict
             }
-        })
+        }, game_data=game_data, tags=tags)
 
-        if game_info:
-            # top_games_data.jsonのデータを保持しつつ、新しいデータを追加
-            enriched_game = {
-                'game_title': game_title,
-                'twitch_id': twitch_id,
+    if not game_info:
+        return None
+
+    # top_games_data.jsonのデータを保持しつつ、新しいデータを追加
+    return {
+        'game_title': game_title,
+        'twitch_id': twitch_id,
+        'steam_id': steam_id,
+        'genres': game_info.get('genres', []),
+        'webpage_url': game_info.get('webpage_url', ''),
+        'img_url': game_info.get('img_url', ''),
+        'price': game_info.get('price', 0.0),
+        'sale_price': game_info.get('sale_price', 0.0),
+        'is_single_player': game_info.get('is_single_player', False),
+        'is_multi_player': game_info.get('is_multi_player', False),
+        'is_device_windows': game_info.get('is_device_windows', False),
+        'is_device_mac': game_info.get('is_device_mac', False),
+        'play_time': game_info.get('play_time', 0),
+        'review_text': game_info.get('review_text', {}),
+        'difficulty': game_info.get('difficulty', 3.0),
+        'graphics': game_info.get('graphics', 3.0),
+        'story': game_info.get('story', 3.0),
+        'music': game_info.get('music', 3.0),
+        'developer_name': game_info.get('developer_name', 'Unknown'),
+        'short_details': game_info.get('short_details', ''),
+        'release_date': game_info.get('release_date', ''),
+        'tags': game_info.get('tags', []),
+        'total_views': total_views,
+        'active_user': activity_data['active_user'],
+        'active_chat_user': activity_data['active_chat_user']
+    }
+
+def finish_pending_game(entry, idf_model=None):
+    if entry['game_data'] is None:
+        return None
+    analysis = entry['accumulator'].summary()
+    stage_idf_update(idf_model, analysis)
+    return build_enriched_game(entry['steam_id'], entry['game'], entry['game_data'], entry['tags'], analysis)
+
+def iter_enriched_games(prefetched, nlp_workers=0, max_features=None, idf_model=None):
+    # 入力順に各ゲームの結果（取得できなかった場合はNone）を返す
+    if nlp_workers <= 0:
+        for (steam_id, game), resources in prefetched:
+            yield enrich_game(steam_id, game, resources, max_features=max_features, idf_model=idf_model)
+        return
+
+    # 形態素解析はGILに縛られるため、レビューのページ単位でワーカープロセスに振り分け、
+    # 結果はゲームごとの集計に投入順で合算する（ページの本文は解析に渡した時点で手放す）
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=nlp_workers, mp_context=context, initializer=init_nlp_worker,
+                             initargs=(idf_model, instrumentation.get_metrics().trace_memory)) as pool:
+        # 結果を返す前のゲーム（入力順）と、解析中のページ（投入順）
+        pending = deque()
+        batches = deque()
+
+        def merge_oldest_batch():
+            entry, future = batches.popleft()
+            partial = future.result()
+            instrumentation.get_metrics().merge(partial.pop('metrics', None))
+            entry['accumulator'].merge(partial)
+            entry['remaining'] -= 1
+
+        for (steam_id, game), (review_batches, game_data, tags) in prefetched:
+            entry = {
                 'steam_id': steam_id,
-                'genres': game_info.get('genres', []),
-                'webpage_url': game_info.get('webpage_url', ''),
-                'img_url': game_info.get('img_url', ''),
-                'price': game_info.get('price', 0.0),
-                'sale_price': game_info.get('sale_price', 0.0),
-                'is_single_player': game_info.get('is_single_player', False),
-                'is_multi_player': game_info.get('is_multi_player', False),
-                'is_device_windows': game_info.get('is_device_windows', False),
-                'is_device_mac': game_info.get('is_device_mac', False),
-                'play_time': game_info.get('play_time', 0),
-                'review_text': game_info.get('review_text', {}),
-                'difficulty': game_info.get('difficulty', 3.0),
-                'graphics': game_info.get('graphics', 3.0),
-                'story': game_info.get('story', 3.0),
-                'music': game_info.get('music', 3.0),
-                'developer_name': game_info.get('developer_name', 'Unknown'),
-                'short_details': game_info.get('short_details', ''),
-                'release_date': game_info.get('release_date', ''),
-                'tags': game_info.get('tags', []),
-                'total_views': total_views,
-                'active_user': activity_data['active_user'],
-                'active_chat_user': activity_data['active_chat_user']
+                'game': game,
+                'game_data': game_data,
+                'tags': tags,
+                'accumulator': ReviewAccumulator(ASPECT_EXPRESSIONS, max_features=max_features, idf_model=idf_model),
+                'remaining': 0
             }
+            pending.append(entry)
+            if game_data is not None:
+                for raw_reviews in review_batches:
+                    reviews, playtimes = review_texts_and_playtimes(raw_reviews)
+                    review_ids = [review.get("recommendationid") for review in raw_reviews]
+                    batches.append((entry, pool.submit(analyze_review_batch, reviews, playtimes, review_ids,
+                                                       max_features=max_features)))
+                    entry['remaining'] += 1
+                    # 解析待ちのページが溜まりすぎないよう、古いものから順に結果を合算する
+                    while len(batches) > nlp_workers * 2:
+                        merge_oldest_batch()
+            # 解析し終えたゲームと、溜まりすぎた古いゲームの結果を入力順に取り出す
+            while pending and (not pending[0]['remaining'] or len(pending) > nlp_workers * 2):
+                while pending[0]['remaining']:
+                    merge_oldest_batch()
+                yield finish_pending_game(pending.popleft(), idf_model)
+        while pending:
+            while pending[0]['remaining']:
+                merge_oldest_batch()
+            yield finish_pending_game(pending.popleft(), idf_model)
+
+def build_idf_model(review_store_path, idf_model_path):
+    # レビューストアに保存済みのレビューからIDFモデルを作る（または未集計の分を追加する）
+    # モデルが空のまま --idf-model を使うと、すべての単語のIDFが1になりTFだけの重み付けになる
+    if not os.path.exists(review_store_path):
+        print(f"{review_store_path}が見つかりません。")
+        return
+    review_store = ReviewStore(review_store_path)
+    idf_model = IdfModel.load(idf_model_path)
+    try:
+        appids = review_store.appids()
+        for appid in tqdm(appids, desc="Building IDF model"):
+            for raw_reviews in review_store.iter_review_batches(appid, review_store.count(appid)):
+                pairs = [(" ".join(AnalyzedReview(review['review']).content_words()), int(review['recommendationid']))
+                         for review in raw_reviews]
+                seen = idf_model.is_seen([review_id for _, review_id in pairs])
+                new_pairs = [pair for pair, is_seen in zip(pairs, seen) if not is_seen]
+                idf_model.stage(document_frequency_delta(review for review, _ in new_pairs),
+                                [review_id for _, review_id in new_pairs])
+        idf_model.commit()
+        idf_model.save(idf_model_path)
+        print(f"IDFモデルを '{idf_model_path}' に保存しました（ゲーム数 {len(appids)}, "
+              f"単語数 {len(idf_model.terms)}, 文書数 {idf_model.document_count}）。")
+    finally:
+        review_store.close()
+
+def main(workers=DEFAULT_WORKERS, max_reviews=REVIEW_BUDGET, nlp_workers=0,
+         max_features=None, idf_model_path=None, review_store_path=None, offline=False,
+         input_file=None, output_file=None, ndjson=False, follow=False, resume=False,
+         metrics_path=None, prometheus_path=None, trace_memory=False):
+    # 出力ファイルのパスをスクリプトと同ディレクトリに設定
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    instrumentation.start_run('fetch_and_parse_steam', trace_memory=trace_memory)
+
+    if ndjson:
+        # 1行1ゲームの入力を必要な分だけ読み込む（follow の場合は前段の書き込みに追従する）
+        input_file = input_file or 'top_games_data.ndjson'
+        if not follow and not os.path.exists(input_file):
+            print(f"{input_file}が見つかりません。")
+            return
+        # JSONのキーと同じく、Steam IDは文字列として扱う
+        top_games_items = (
+            (str(game['steam_id']) if game.get('steam_id') else None, game)
+            for game in iter_ndjson(input_file, follow=follow)
+        )
+        total = None
+    else:
+        # top_games_data.jsonからデータを読み込む
+        input_file = input_file or 'top_games_data.json'
+        try:
+            with open(input_file, 'r', encoding='utf-8') as f:
+                top_games_data = json.load(f)
+            if not isinstance(top_games_data, dict):
+                print(f"{input_file}の形式が正しくありません。")
+                return
+            print(f"読み込んだゲームの数: {len(top_games_data)}")
+        except Exception as e:
+            print(f"{input_file}の読み込みに失敗しました: {e}")
+            return
+        top_games_items = top_games_data.items()
+        total = len(top_games_data)
+
+    # 結果を格納するリスト（ndjson の場合は解析し終えたゲームから1行ずつ書き出す）
+    all_data = []
+    writer = None
+    if ndjson:
+        output_file = output_file or os.path.join(script_dir, 'all_top_games_data.ndjson')
+    else:
+        output_file = output_file or os.path.join(script_dir, 'all_top_games_data.json')
+
+    # 処理し終えたゲームはジャーナルに記録し、--resume の場合は記録済みのゲームを飛ばす
+    journal = RunJournal(journal_path_for(output_file), resume=resume)
+    if len(journal):
+        print(f"ジャーナルから {len(journal)} 件の処理済みのゲームを再開します。")
+    if ndjson:
+        writer = NdjsonWriter(output_file)
+        for record in journal.records.values():
+            writer.write(record)
+    else:
+        all_data.extend(journal.records.values())
 
+    # Steam IDの存在確認
+    def iter_games():
+        for steam_id, game in top_games_items:
+            if not steam_id:
+                print(f"Steam IDが存在しないゲーム: {game.get('game_title')}. スキップします。")
+                continue
+            if steam_id in journal:
+                continue
+            yield steam_id, game
+    games = iter_games()
+    if total is not None:
+        total = sum(1 for steam_id in top_games_data if steam_id and steam_id not in journal)
+
+    # 全ゲーム共通のIDFモデル（指定がない場合はゲームごとにTF-IDFを学習する）
+    idf_model = None
+    if idf_model_path:
+        try:
+            idf_model = IdfModel.load(idf_model_path)
+            print(f"IDFモデルを読み込みました: 単語数 {len(idf_model.terms)}, 文書数 {idf_model.document_count}")
+            if not idf_model.document_count:
+                print("警告: IDFモデルが空のため、今回の実行ではIDFが使われずTFだけで重み付けされます。"
+                      "先に --build-idf-model でレビューストアからモデルを作成してください。")
+        except Exception as e:
+            print(f"IDFモデルの読み込みに失敗しました: {e}")
+            return
+
+    # ローカルのレビューストア（指定がない場合は毎回APIからレビューを取得する）
+    review_store = None
+    if review_store_path:
+        review_store = ReviewStore(review_store_path)
+    elif offline:
+        print("--offline を使うには --review-store の指定が必要です。")
+        return
+
+    # HTTP通信は先読みスレッドで行い、解析はメインスレッド（またはワーカープロセス）で入力順に行う
+    prefetched = iter_prefetched(
+        lambda item: fetch_game_resources(item[0], max_reviews=max_reviews, review_store=review_store,
+                                          offline=offline),
+        games, workers
+    )
+    prefetched = tqdm(prefetched, total=total, desc="Processing games")
+    for enriched_game in iter_enriched_games(prefetched, nlp_workers=nlp_workers, max_features=max_features,
+                                             idf_model=idf_model):
+        if not enriched_game:
+            instrumentation.increment('games_skipped')
+            continue
+        instrumentation.increment('games_processed')
+        journal.append(enriched_game['steam_id'], enriched_game)
+        if writer is not None:
+            writer.write(enriched_game)
+        else:
             all_data.append(enriched_game)
 
-        time.sleep(1)
+    journal.sync()
+    if writer is not None:
+        writer.close()
+        journal.discard()
+        print(f"すべての結果を '{output_file}' に保存しました。")
+
+    # 今回新しく取得したレビューの文書頻度をIDFモデルに反映して保存
+    if idf_model is not None:
+        try:
+            idf_model.commit()
+            idf_model.save(idf_model_path)
+            print(f"IDFモデルを '{idf_model_path}' に保存しました（文書数 {idf_model.document_count}）。")
+        except Exception as e:
+            print(f"IDFモデルの保存に失敗しました: {e}")
+
+    if review_store is not None:
+        review_store.close()
+
+    http_client.log_connection_stats()
 
     # 結果をJSONファイルに保存
-    try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=4)
-        print(f"すべての結果を '{output_file}' に保存しました。")
-    except Exception as e:
-        print(f"結果の保存に失敗しました: {e}")
+    if writer is None:
+        try:
+            with instrumentation.stage('write_output'):
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    json.dump(all_data, f, ensure_ascii=False, indent=4)
+            journal.discard()
+            print(f"すべての結果を '{output_file}' に保存しました。")
+        except Exception as e:
+            print(f"結果の保存に失敗しました（ジャーナルは '{journal.path}' に残っています）: {e}")
+
+    instrumentation.finish_run(metrics_path or metrics_path_for(output_file), prometheus_path)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Steamのレビューと詳細情報を取得して解析します。")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="HTTP通信を先読みするワーカースレッド数")
+    parser.add_argument('--review-budget', type=int, default=REVIEW_BUDGET,
+                        help="1ゲームあたりに取得するレビューの上限")
+    parser.add_argument('--nlp-workers', type=int, default=0,
+                        help="形態素解析を行うワーカープロセス数（0の場合はメインプロセスで解析）")
+    parser.add_argument('--max-vocabulary', type=int, default=None,
+                        help="TF-IDFで扱う語彙数の上限（出現頻度の高い順）")
+    parser.add_argument('--idf-model', default=None,
+                        help="全ゲーム共通のIDFモデルのファイル（.npz）。指定した場合は実行ごとに差分を反映する")
+    parser.add_argument('--review-store', default=None,
+                        help="レビューを保存するSQLiteファイル。指定した場合は新着レビューだけを取得する")
+    parser.add_argument('--build-idf-model', action='store_true',
+                        help="--review-store のレビューから --idf-model のモデルを作成（追加分を反映）して終了する")
+    parser.add_argument('--offline', action='store_true',
+                        help="レビューを取得せず、レビューストアに保存済みのレビューだけで解析する")
+    parser.add_argument('--input', default=None,
+                        help="入力ファイル（既定: top_games_data.json、--ndjson の場合は top_games_data.ndjson）")
+    parser.add_argument('--output', default=None,
+                        help="出力ファイル（既定: all_top_games_data.json、--ndjson の場合は all_top_games_data.ndjson）")
+    parser.add_argument('--ndjson', action='store_true',
+                        help="1行1ゲームの形式で読み書きし、解析し終えたゲームから順に書き出す")
+    parser.add_argument('--follow', action='store_true',
+                        help="--ndjson の入力を、前段が書き終える（.doneマーカーができる）まで追従して読み込む")
+    parser.add_argument('--resume', action='store_true',
+                        help="前回中断した実行のジャーナルを読み込み、処理済みのゲームを飛ばして再開する")
+    parser.add_argument('--metrics', default=None,
+                        help="段階ごとの処理時間などの計測結果を書き出すJSONファイル（既定: 出力ファイル名.metrics.json）")
+    parser.add_argument('--prometheus', default=None,
+                        help="計測結果をPrometheusのテキスト形式でも書き出すファイル（textfile collector 用）")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="tracemallocで段階ごとのピークメモリを計測する（解析が遅くなる）")
+    return parser.parse_args()
 
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    if args.build_idf_model:
+        if not args.review_store or not args.idf_model:
+            print("--build-idf-model には --review-store と --idf-model の指定が必要です。")
+            sys.exit(1)
+        build_idf_model(args.review_store, args.idf_model)
+        sys.exit(0)
+    main(workers=args.workers, max_reviews=args.review_budget,
+         nlp_workers=args.nlp_workers, max_features=args.max_vocabulary, idf_model_path=args.idf_model,
+         review_store_path=args.review_store, offline=args.offline, input_file=args.input,
+         output_file=args.output, ndjson=args.ndjson, follow=args.follow, resume=args.resume,
+         metrics_path=args.metrics, prometheus_path=args.prometheus, trace_memory=args.trace_memory)
@@ -1,33 +1,27 @@
-import requests
+import argparse
 import json
 import os
 import sys
-import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
 from tqdm import tqdm
 
-from getAccessToken import get_access_token
+import http_client
+import instrumentation
+from instrumentation import metrics_path_for
+from json_stream import NdjsonWriter
+from run_journal import RunJournal, journal_path_for
+from app_index import APP_INDEX_PATH, AppIndex
+from title_matcher import TitleMatcher
+from token_provider import get_token_provider
 
 from dotenv import load_dotenv
 
 # load_dotenv()
 
-CLIENT_ID = os.getenv('CLIENT_ID')
-
-def transform_data_to_dict(data):
-    transformed_dict = {}
-    for item in data:
-        name = item.get('name')
-        appid = item.get('appid')
-        if name and appid:
-            transformed_dict[name] = appid
-    return transformed_dict
-
-def fetch_twitch_top_games(token, first=100):
+def fetch_twitch_top_games(tokens, first=100):
     base_url = 'https://api.twitch.tv/helix/games/top'
-    headers = {
-        'Client-ID': CLIENT_ID,
-        'Authorization': f'Bearer {token}',
-    }
     params = {
         'first': first
     }
@@ -37,7 +31,7 @@ def fetch_twitch_top_games(token, first=100):
     while True:
         if cursor:
             params['after'] = cursor
-        response = requests.get(base_url, headers=headers, params=params)
+        response = tokens.get(base_url, params=params)
         if response.status_code != 200:
             print(f"Twitch APIのリクエストに失敗しました。ステータスコード: {response.status_code}")
             break
@@ -47,26 +41,29 @@ def fetch_twitch_top_games(token, first=100):
         cursor = data.get('pagination', {}).get('cursor', None)
         if not cursor:
             break
-        time.sleep(1)
     return top_games
 
-def fetch_steam_app_list():
-    url = 'https://api.steampowered.com/ISteamApps/GetAppList/v2/'
-    response = requests.get(url)
-    if response.status_code != 200:
-        print(f"Steam APIのリクエストに失敗しました。ステータスコード: {response.status_code}")
-        return {}
-    data = response.json()
-    apps = data.get('applist', {}).get('apps', [])
-    steam_games_dict = transform_data_to_dict(apps)
-    return steam_games_dict
-
-def fetch_total_views(twitch_id, token):
+DEFAULT_WORKERS = 8
+DEFAULT_VIDEO_PAGES = 5
+POPULARITY_SOURCES = ('videos', 'streams')
+# helix/streams で一度に指定できる game_id の数
+STREAMS_GAME_IDS_PER_REQUEST = 100
+
+def fetch_steam_app_list(index_path=APP_INDEX_PATH):
+    # ローカルのアプリ索引を（必要な場合だけ）更新して返す
+    # 返り値は名前→appidの辞書と同じく get() と len() で使える
+    app_index = AppIndex(index_path)
+    try:
+        updated = app_index.refresh()
+        if updated:
+            print(f"Steamのアプリ索引を更新しました: {updated} 件")
+    except Exception as e:
+        print(f"Steamのアプリ索引の更新に失敗しました。保存済みの索引を使用します: {e}")
+    return app_index
+
+def fetch_total_views(twitch_id, tokens, max_pages=DEFAULT_VIDEO_PAGES):
+    # 視聴回数の多い順に並んだビデオを、カーソルをたどって最大 max_pages ページ分合計する
     url = 'https://api.twitch.tv/helix/videos'
-    headers = {
-        'Client-ID': CLIENT_ID,
-        'Authorization': f'Bearer {token}',
-    }
     params = {
         'sort': 'views',
         'game_id': twitch_id,
@@ -74,20 +71,62 @@ def fetch_total_views(twitch_id, token):
         'first': 100
     }
     total_views = 0
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code != 200:
-        print(f"Twitch ビデオAPIのリクエストに失敗しました。ステータスコード: {response.status_code}")
-        return total_views
-    data = response.json()
-    videos = data.get('data', [])
-    for video in videos:
-        total_views += video.get('view_count', 0)
+    for _ in range(max_pages):
+        # 失敗した場合は、それまでのページの合計をこのゲームの視聴回数とする
+        try:
+            response = tokens.get(url, params=params)
+            if response.status_code != 200:
+                print(f"Twitch ビデオAPIのリクエストに失敗しました。ステータスコード: {response.status_code}")
+                break
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"Twitch ビデオAPIの取得中にエラーが発生しました。Twitch ID: {twitch_id}, エラー: {e}")
+            break
+        videos = data.get('data', [])
+        for video in videos:
+            total_views += video.get('view_count', 0)
+        cursor = data.get('pagination', {}).get('cursor')
+        if not videos or not cursor:
+            break
+        params['after'] = cursor
     return total_views
 
+def fetch_live_viewers(twitch_ids, tokens):
+    # 配信中のストリームをページ単位でたどり、viewer_count を game_id ごとに合計する
+    # 対象のゲームを100件ずつまとめて指定するため、リクエスト数はゲーム数ではなくページ数で決まる
+    url = 'https://api.twitch.tv/helix/streams'
+    twitch_ids = list(dict.fromkeys(str(twitch_id) for twitch_id in twitch_ids))
+    viewers = Counter({twitch_id: 0 for twitch_id in twitch_ids})
+    for start in range(0, len(twitch_ids), STREAMS_GAME_IDS_PER_REQUEST):
+        params = {
+            'game_id': twitch_ids[start:start + STREAMS_GAME_IDS_PER_REQUEST],
+            'first': 100
+        }
+        while True:
+            # 失敗した場合は、このまとまりのゲームはそれまでのページの合計とし、次のまとまりに進む
+            try:
+                response = tokens.get(url, params=params)
+                if response.status_code != 200:
+                    print(f"Twitch ストリームAPIのリクエストに失敗しました。ステータスコード: {response.status_code}")
+                    break
+                data = response.json()
+            except (requests.RequestException, ValueError) as e:
+                print(f"Twitch ストリームAPIの取得中にエラーが発生しました。"
+                      f"対象のゲーム: {len(params['game_id'])} 件, エラー: {e}")
+                break
+            streams = data.get('data', [])
+            for stream in streams:
+                viewers[stream.get('game_id')] += stream.get('viewer_count', 0)
+            cursor = data.get('pagination', {}).get('cursor')
+            if not streams or not cursor:
+                break
+            params['after'] = cursor
+    return viewers
+
 def fetch_activity_data(steam_id):
     url = f"https://steam-active-scrape.netlify.app/.netlify/functions/activity?gameId={steam_id}"
     try:
-        response = requests.get(url)
+        response = http_client.get(url)
         if response.status_code != 200:
             print(f"SteamアクティビティAPIのリクエストに失敗しました。ステータスコード: {response.status_code}")
             return {'active_user': 0, 'active_chat_user': 0}
@@ -99,23 +138,53 @@ def fetch_activity_data(steam_id):
         print(f"SteamアクティビティAPIの取得中にエラーが発生しました。Steam ID: {steam_id}, エラー: {e}")
         return {'active_user': 0, 'active_chat_user': 0}
 
-def main():
-    token = get_access_token()
-    if not token:
+def fetch_game_stats(game, tokens, max_pages=DEFAULT_VIDEO_PAGES, total_views=None):
+    twitch_id = game['twitch_id']
+    steam_id = game['steam_id']
+
+    # Twitchの総視聴回数を取得（配信中の視聴者数を集計済みの場合はそれを使う）
+    if total_views is None:
+        with instrumentation.stage('fetch_total_views'):
+            total_views = fetch_total_views(twitch_id, tokens, max_pages)
+
+    # Steamアクティビティデータを取得
+    with instrumentation.stage('fetch_activity_data'):
+        activity_data = fetch_activity_data(steam_id)
+
+    # データを統合
+    return {
+        'twitch_id': twitch_id,
+        'steam_id': steam_id,
+        'game_title': game['game_title'],
+        'total_views': total_views,
+        'active_user': activity_data['active_user'],
+        'active_chat_user': activity_data['active_chat_user']
+    }
+
+def main(workers=DEFAULT_WORKERS, max_pages=DEFAULT_VIDEO_PAGES, popularity='videos', output_format='json',
+         resume=False, metrics_path=None, prometheus_path=None, trace_memory=False):
+    instrumentation.start_run('fetch_top_games', trace_memory=trace_memory)
+
+    # トークンは最初に使うときに解決され、期限切れや401の場合は自動で更新される
+    tokens = get_token_provider()
+    if not tokens.token():
         print("アクセストークンの取得に失敗しました。")
         sys.exit(1)
     
     # Twitchのトップゲームを取得
     print("Twitch APIからトップゲームを取得中...")
-    top_games = fetch_twitch_top_games(token)
+    with instrumentation.stage('fetch_twitch_top_games'):
+        top_games = fetch_twitch_top_games(tokens)
     print(f"取得したトップゲームの数: {len(top_games)}")
     
     # Steamのゲームリストを取得
     print("Steam APIからゲームリストを取得中...")
-    steam_games_dict = fetch_steam_app_list()
+    with instrumentation.stage('fetch_steam_app_list'):
+        steam_games_dict = fetch_steam_app_list()
     print(f"Steamで認識されているゲームの数: {len(steam_games_dict)}")
     
-    # 一致するゲームを特定
+    # 一致するゲームを特定（表記揺れを吸収し、確定した対応は索引に保存して再利用する）
+    matcher = TitleMatcher(steam_games_dict)
     matched_games = []
     for game in top_games:
         game_title = game.get('name')
@@ -124,7 +193,8 @@ def main():
             continue
         if game_title == 'Just Chatting':
             continue
-        steam_id = steam_games_dict.get(game_title)
+        with instrumentation.stage('match_title'):
+            steam_id = matcher.match(twitch_id, game_title)
         if steam_id:
             matched_games.append({
                 'twitch_id': twitch_id,
@@ -132,43 +202,113 @@ def main():
                 'game_title': game_title
             })
     
+    # 同じSteamのゲームに対応するTwitchのゲームが複数ある場合は、ランキングが上位のものだけを使う
+    unique_games = {}
+    for game in matched_games:
+        unique_games.setdefault(game['steam_id'], game)
+    matched_games = list(unique_games.values())
+
     print(f"マッチしたゲームの数: {len(matched_games)}")
+    instrumentation.increment('games_matched', len(matched_games))
     
     # 視聴回数とアクティビティデータを取得
     all_data = {}
     print("各ゲームの視聴回数とアクティビティデータを取得中...")
-    
-    for game in tqdm(matched_games, desc="Fetching data"):
-        twitch_id = game['twitch_id']
-        steam_id = game['steam_id']
-        game_title = game['game_title']
-        
-        # Twitchの総視聴回数を取得
-        total_views = fetch_total_views(twitch_id, token)
-        
-        # Steamアクティビティデータを取得
-        activity_data = fetch_activity_data(steam_id)
-        
-        # データを統合
-        all_data[steam_id] = {
-            'twitch_id': twitch_id,
-            'steam_id': steam_id,
-            'game_title': game_title,
-            'total_views': total_views,
-            'active_user': activity_data['active_user'],
-            'active_chat_user': activity_data['active_chat_user']
-        }
-        
-        time.sleep(1)
 
+    # 結果はランキング順に出力する。ndjson の場合は、先頭から順に取得し終えたものを1行ずつ書き出し、
+    # 後段がすぐに読み始められるようにする
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    output_file = os.path.join(script_dir, 'top_games_data.json')
-    try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=4)
+    writer = None
+    if output_format == 'ndjson':
+        output_file = os.path.join(script_dir, 'top_games_data.ndjson')
+    else:
+        output_file = os.path.join(script_dir, 'top_games_data.json')
+
+    # 取得し終えたゲームはジャーナルに記録し、--resume の場合は記録済みのゲームを取得し直さない
+    journal = RunJournal(journal_path_for(output_file), resume=resume)
+    if len(journal):
+        print(f"ジャーナルから {len(journal)} 件の取得済みのゲームを再開します。")
+    if output_format == 'ndjson':
+        writer = NdjsonWriter(output_file)
+
+    emitted = 0
+
+    def emit_ready():
+        # ランキング順で、まだ出力していない先頭のゲームから取得済みのものを出力する
+        nonlocal emitted
+        while emitted < len(matched_games) and matched_games[emitted]['steam_id'] in journal:
+            game_stats = journal.records[str(matched_games[emitted]['steam_id'])]
+            if writer is not None:
+                writer.write(game_stats)
+            else:
+                all_data[game_stats['steam_id']] = game_stats
+            emitted += 1
+
+    emit_ready()
+    remaining_games = [game for game in matched_games if game['steam_id'] not in journal]
+
+    # streams の場合は、配信中の視聴者数を全ゲーム分まとめて1回の走査で集計する
+    live_viewers = None
+    if popularity == 'streams':
+        with instrumentation.stage('fetch_live_viewers'):
+            live_viewers = fetch_live_viewers([game['twitch_id'] for game in remaining_games], tokens)
+
+    # ゲームごとの取得を並列に行い、終わったものはジャーナルに記録してから順番に出力する
+    # Twitchのポイント上限は http_client の共有レート制限で守られる
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                fetch_game_stats, game, tokens, max_pages,
+                live_viewers[str(game['twitch_id'])] if live_viewers is not None else None
+            )
+            for game in remaining_games
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Fetching data"):
+            game_stats = future.result()
+            instrumentation.increment('games_processed')
+            journal.append(game_stats['steam_id'], game_stats)
+            emit_ready()
+
+    journal.sync()
+    if writer is not None:
+        writer.close()
+        journal.discard()
         print(f"結果を '{output_file}' に保存しました。")
-    except Exception as e:
-        print(f"JSONファイルへの保存に失敗しました: {e}")
+    else:
+        try:
+            with instrumentation.stage('write_output'):
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    json.dump(all_data, f, ensure_ascii=False, indent=4)
+            journal.discard()
+            print(f"結果を '{output_file}' に保存しました。")
+        except Exception as e:
+            print(f"JSONファイルへの保存に失敗しました（ジャーナルは '{journal.path}' に残っています）: {e}")
+
+    http_client.log_connection_stats()
+    instrumentation.finish_run(metrics_path or metrics_path_for(output_file), prometheus_path)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Twitchのトップゲームと対応するSteamのゲームを取得します。")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="視聴回数とアクティビティを並列に取得するワーカースレッド数")
+    parser.add_argument('--video-pages', type=int, default=DEFAULT_VIDEO_PAGES,
+                        help="1ゲームあたりにたどるビデオ一覧のページ数（1ページ100件）")
+    parser.add_argument('--popularity', choices=POPULARITY_SOURCES, default='videos',
+                        help="total_views の集計元（videos: ビデオの視聴回数、streams: 配信中の視聴者数）")
+    parser.add_argument('--format', choices=('json', 'ndjson'), default='json',
+                        help="出力形式（ndjson: 1ゲーム1行で、取得し終えたものから順に書き出す）")
+    parser.add_argument('--resume', action='store_true',
+                        help="前回中断した実行のジャーナルを読み込み、取得済みのゲームを飛ばして再開する")
+    parser.add_argument('--metrics', default=None,
+                        help="段階ごとの処理時間などの計測結果を書き出すJSONファイル（既定: 出力ファイル名.metrics.json）")
+    parser.add_argument('--prometheus', default=None,
+                        help="計測結果をPrometheusのテキスト形式でも書き出すファイル（textfile collector 用）")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="tracemallocで段階ごとのピークメモリを計測する")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(workers=args.workers, max_pages=args.video_pages, popularity=args.popularity, output_format=args.format,
+         resume=args.resume, metrics_path=args.metrics, prometheus_path=args.prometheus,
+         trace_memory=args.trace_memory)
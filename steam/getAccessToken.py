@@ -1,44 +1,38 @@
 import os
-import psycopg2
 from dotenv import load_dotenv
 import datetime
 
+import db
+
 # load_dotenv()
 
 def get_access_token():
-    cur = None
-    connect = None
+    record = get_access_token_record()
+    if record is None:
+        return None
+    token, expires_time = record
+    # トークンの有効期限を確認し、まだ有効な場合はそれを返す
+    if expires_time > datetime.datetime.now():
+        return token
+    print("トークンの有効期限が切れています。")
+    return None
+
+def get_access_token_record():
+    # 最新のトークンとその有効期限を返す（見つからない場合はNone）
     try:
-        connect = psycopg2.connect(
-            host=os.getenv('PGHOST'),
-            user=os.getenv('PGUSER'),
-            password=os.getenv('PGPASSWORD'),
-            dbname=os.getenv('PGDATABASE'),
-            port=os.getenv('PGPORT')
-        )
-        cur = connect.cursor()
+        with db.connection() as connect, connect.cursor() as cur:
+            cur.execute("""
+                SELECT token, expires_time
+                FROM access_token
+                WHERE client_id = %s
+                ORDER BY get_date DESC
+                LIMIT 1
+            """, (os.getenv('CLIENT_ID'),))
 
-        cur.execute("""
-            SELECT token, expires_time
-            FROM access_token
-            WHERE client_id = %s
-            ORDER BY get_date DESC
-            LIMIT 1
-        """, (os.getenv('CLIENT_ID'),))
+            token_record = cur.fetchone()
 
-        token_record = cur.fetchone()
-        
         if token_record:
-            token = token_record[0]
-            expires_time = token_record[1]
-            current_time = datetime.datetime.now()
-
-            # トークンの有効期限を確認し、まだ有効な場合はそれを返す
-            if expires_time > current_time:
-                return token
-            else:
-                print("トークンの有効期限が切れています。")
-                return None
+            return token_record[0], token_record[1]
         else:
             print("データベースにトークンが見つかりませんでした。")
             return None
@@ -46,9 +40,3 @@ def get_access_token():
     except Exception as e:
         print(f"データベースからトークンを取得できませんでした: {e}")
         return None
-
-    finally:
-        if cur:
-            cur.close()
-        if connect:
-            connect.close()
@@ -0,0 +1,97 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrumentation
+from rate_budget import get_rate_budget
+
+# 接続タイムアウトと読み込みタイムアウト（秒）
+DEFAULT_TIMEOUT = (5, 30)
+
+# キャッシュするホストごとのコネクションプールの数と、1ホストあたりの最大接続数
+POOL_CONNECTIONS = 20
+POOL_MAXSIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    # すべてのフェッチャーで共有するセッション（ホストごとの接続をKeep-Aliveで使い回す）
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+            _session = session
+    return _session
+
+
+def _client_id(headers):
+    for name, value in (headers or {}).items():
+        if name.lower() == 'client-id':
+            return value
+    return None
+
+
+def request(method, url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    # 送信前に共有のレート制限の枠を確保し、レスポンスのヘッダーで残量を更新する
+    client_id = _client_id(kwargs.get('headers'))
+    budget = get_rate_budget()
+    with instrumentation.stage('rate_budget_wait'):
+        budget.acquire(url, client_id)
+    # 応答時間はレート制限の待ち時間を含めず、ホストごとに記録する
+    host = urlparse(url).netloc
+    started = time.perf_counter()
+    try:
+        response = get_session().request(method, url, timeout=timeout, **kwargs)
+    except Exception:
+        instrumentation.observe_http(host, time.perf_counter() - started, 'error')
+        raise
+    instrumentation.observe_http(host, time.perf_counter() - started, response.status_code)
+    budget.update_from_headers(url, client_id, response.headers)
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def connection_stats():
+    # ホストごとのリクエスト数と新規接続数（urllib3のコネクションプールの統計）
+    stats = {}
+    session = _session
+    if session is None:
+        return stats
+    for adapter in {id(adapter): adapter for adapter in session.adapters.values()}.values():
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host_stats = stats.setdefault(pool.host, {'requests': 0, 'connections': 0})
+            host_stats['requests'] += pool.num_requests
+            host_stats['connections'] += pool.num_connections
+    return stats
+
+
+def log_connection_stats():
+    stats = connection_stats()
+    if not stats:
+        return
+    print("HTTP接続の再利用状況:")
+    for host, host_stats in sorted(stats.items()):
+        requests_count = host_stats['requests']
+        connections = host_stats['connections']
+        reuse_rate = (1 - connections / requests_count) * 100 if requests_count else 0.0
+        print(f"  {host}: リクエスト {requests_count} / 新規接続 {connections}（再利用率 {reuse_rate:.1f}%）")
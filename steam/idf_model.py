@@ -0,0 +1,104 @@
+import os
+from collections import Counter
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+
+class IdfModel:
+    # 全ゲームのレビューを通した文書頻度（DF）を保持し、新しいレビューの分だけ更新できるIDFモデル
+    # 1回の実行中は読み込んだ時点の値で重み付けを行い、追加分は commit() でまとめて反映する
+    # 最初のモデルは fetch_and_parse_steam.py --build-idf-model でレビューストアから作成する
+    def __init__(self, terms=None, document_frequencies=None, document_count=0, seen_ids=None):
+        self.terms = list(terms or [])
+        self.index = {term: i for i, term in enumerate(self.terms)}
+        if document_frequencies is None:
+            document_frequencies = np.zeros(len(self.terms), dtype=np.int64)
+        self.document_frequencies = np.asarray(document_frequencies, dtype=np.int64)
+        self.document_count = int(document_count)
+        # 集計済みのレビュー（recommendationid）を昇順の配列で保持する
+        if seen_ids is None:
+            seen_ids = np.zeros(0, dtype=np.uint64)
+        self.seen_ids = np.unique(np.asarray(seen_ids, dtype=np.uint64))
+        self.pending_frequencies = Counter()
+        self.pending_ids = []
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                terms=data['terms'].tolist(),
+                document_frequencies=data['document_frequencies'],
+                document_count=int(data['document_count']),
+                seen_ids=data['seen_ids']
+            )
+
+    def save(self, path):
+        # 書き込み途中で中断しても既存のモデルが壊れないよう、一時ファイル経由で置き換える
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                terms=np.array(self.terms, dtype=str),
+                document_frequencies=self.document_frequencies,
+                document_count=np.int64(self.document_count),
+                seen_ids=self.seen_ids
+            )
+        os.replace(tmp_path, path)
+
+    def is_seen(self, review_ids):
+        review_ids = np.asarray(review_ids, dtype=np.uint64)
+        if not self.seen_ids.size:
+            return np.zeros(review_ids.shape, dtype=bool)
+        positions = np.searchsorted(self.seen_ids, review_ids)
+        positions[positions == self.seen_ids.size] = 0
+        return self.seen_ids[positions] == review_ids
+
+    def idf(self, terms):
+        # TfidfVectorizer（smooth_idf=True）と同じ式。コーパスに未出現の単語はDF=0として扱う
+        frequencies = np.fromiter(
+            (self.document_frequencies[self.index[term]] if term in self.index else 0 for term in terms),
+            dtype=np.float64, count=len(terms)
+        )
+        return np.log((1 + self.document_count) / (1 + frequencies)) + 1
+
+    def weigh(self, tokenized_reviews, max_features=None):
+        # 再学習せずに、保持しているIDFでレビュー集合の単語ごとの重みの合計を求める
+        vectorizer = CountVectorizer(tokenizer=str.split, token_pattern=None, max_features=max_features)
+        counts = vectorizer.fit_transform(tokenized_reviews)
+        feature_names = vectorizer.get_feature_names_out()
+        tfidf_matrix = normalize(counts.multiply(self.idf(feature_names)).tocsr())
+        return feature_names, np.asarray(tfidf_matrix.sum(axis=0)).ravel()
+
+    def stage(self, document_frequencies, review_ids):
+        self.pending_frequencies.update(document_frequencies)
+        self.pending_ids.extend(review_ids)
+
+    def commit(self):
+        new_terms = [term for term in self.pending_frequencies if term not in self.index]
+        for term in new_terms:
+            self.index[term] = len(self.terms)
+            self.terms.append(term)
+        if new_terms:
+            self.document_frequencies = np.concatenate(
+                [self.document_frequencies, np.zeros(len(new_terms), dtype=np.int64)]
+            )
+        for term, count in self.pending_frequencies.items():
+            self.document_frequencies[self.index[term]] += count
+        new_ids = np.unique(np.asarray(self.pending_ids, dtype=np.uint64))
+        new_ids = new_ids[~self.is_seen(new_ids)]
+        self.document_count += int(new_ids.size)
+        self.seen_ids = np.union1d(self.seen_ids, new_ids)
+        self.pending_frequencies = Counter()
+        self.pending_ids = []
+
+
+def document_frequency_delta(tokenized_reviews):
+    # CountVectorizer と同じく小文字化した上で、各単語を含むレビュー数を数える
+    frequencies = Counter()
+    for review in tokenized_reviews:
+        frequencies.update(set(review.lower().split()))
+    return frequencies
@@ -1,6 +1,7 @@
+import argparse
+import itertools
 import json
 import psycopg2
-from psycopg2 import extras
 from tqdm import tqdm
 import sys
 import os
@@ -10,263 +11,442 @@ from datetime import datetime
 # 環境変数の読み込み
 # load_dotenv()
 
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 
-# データベース接続情報を環境変数から取得
-PGHOST = os.getenv('PGHOST')
-PGPORT = os.getenv('PGPORT')
-PGDATABASE = os.getenv('PGDATABASE')
-PGUSER = os.getenv('PGUSER')
-PGPASSWORD = os.getenv('PGPASSWORD')
+import db
+from json_stream import is_ndjson_path, iter_ndjson
 
-def main():
-    # PostgreSQL に接続
+DEFAULT_QUARANTINE_PATH = 'insert_data_quarantine.jsonl'
+# ステージングテーブルへ1回のINSERTで送る行数
+BULK_PAGE_SIZE = 1000
+
+# 1. steam_game_data テーブル
+INSERT_STEAM_GAME_DATA = """
+INSERT INTO steam_game_data (
+    steam_game_id,
+    twitch_game_id,
+    game_title,
+    genres,
+    webpage_url,
+    img_url,
+    price,
+    sale_price,
+    is_single_player,
+    is_multi_player,
+    is_device_windows,
+    is_device_mac,
+    play_time,
+    review_text,
+    difficulty,
+    graphics,
+    story,
+    music,
+    developer_name,
+    short_details,
+    release_date,
+    tags
+) VALUES (
+    %(steam_id)s,
+    %(twitch_id)s,
+    %(game_title)s,
+    %(genres)s,
+    %(webpage_url)s,
+    %(img_url)s,
+    %(price)s,
+    %(sale_price)s,
+    %(is_single_player)s,
+    %(is_multi_player)s,
+    %(is_device_windows)s,
+    %(is_device_mac)s,
+    %(play_time)s,
+    %(review_text)s,
+    %(difficulty)s,
+    %(graphics)s,
+    %(story)s,
+    %(music)s,
+    %(developer_name)s,
+    %(short_details)s,
+    %(release_date)s,
+    %(tags)s
+)
+ON CONFLICT (steam_game_id) DO UPDATE SET
+    twitch_game_id = EXCLUDED.twitch_game_id,
+    game_title = EXCLUDED.game_title,
+    genres = EXCLUDED.genres,
+    webpage_url = EXCLUDED.webpage_url,
+    img_url = EXCLUDED.img_url,
+    price = EXCLUDED.price,
+    sale_price = EXCLUDED.sale_price,
+    is_single_player = EXCLUDED.is_single_player,
+    is_multi_player = EXCLUDED.is_multi_player,
+    is_device_windows = EXCLUDED.is_device_windows,
+    is_device_mac = EXCLUDED.is_device_mac,
+    play_time = EXCLUDED.play_time,
+    review_text = EXCLUDED.review_text,
+    difficulty = EXCLUDED.difficulty,
+    graphics = EXCLUDED.graphics,
+    story = EXCLUDED.story,
+    music = EXCLUDED.music,
+    developer_name = EXCLUDED.developer_name,
+    short_details = EXCLUDED.short_details,
+    release_date = EXCLUDED.release_date,
+    tags = EXCLUDED.tags;
+"""
+
+# 2. game_views テーブル
+INSERT_GAME_VIEWS = """
+INSERT INTO game_views (
+    get_date,
+    game_title,
+    twitch_id,
+    steam_id,
+    total_views
+) VALUES (
+    %(get_date)s,
+    %(game_title)s,
+    %(twitch_id)s,
+    %(steam_id)s,
+    %(total_views)s
+)
+ON CONFLICT (get_date, twitch_id, steam_id) DO UPDATE SET
+    total_views = EXCLUDED.total_views;
+"""
+
+# 3. steam_active_users テーブル
+INSERT_STEAM_ACTIVE_USERS = """
+INSERT INTO steam_active_users (
+    steam_id,
+    get_date,
+    active_user,
+    active_chat_user
+) VALUES (
+    %(steam_id)s,
+    %(get_date)s,
+    %(active_user)s,
+    %(active_chat_user)s
+)
+ON CONFLICT (steam_id, get_date) DO UPDATE SET
+    active_user = EXCLUDED.active_user,
+    active_chat_user = EXCLUDED.active_chat_user;
+"""
+
+# 一括モードで使うテーブルごとの定義
+# （テーブル名, (列名, レコードのキー) の並び, 重複判定に使う列, Steam IDの列）
+BULK_TABLES = [
+    ('steam_game_data', [
+        ('steam_game_id', 'steam_id'),
+        ('twitch_game_id', 'twitch_id'),
+        ('game_title', 'game_title'),
+        ('genres', 'genres'),
+        ('webpage_url', 'webpage_url'),
+        ('img_url', 'img_url'),
+        ('price', 'price'),
+        ('sale_price', 'sale_price'),
+        ('is_single_player', 'is_single_player'),
+        ('is_multi_player', 'is_multi_player'),
+        ('is_device_windows', 'is_device_windows'),
+        ('is_device_mac', 'is_device_mac'),
+        ('play_time', 'play_time'),
+        ('review_text', 'review_text'),
+        ('difficulty', 'difficulty'),
+        ('graphics', 'graphics'),
+        ('story', 'story'),
+        ('music', 'music'),
+        ('developer_name', 'developer_name'),
+        ('short_details', 'short_details'),
+        ('release_date', 'release_date'),
+        ('tags', 'tags'),
+    ], ('steam_game_id',), 'steam_game_id'),
+    ('game_views', [
+        ('get_date', 'get_date'),
+        ('game_title', 'game_title'),
+        ('twitch_id', 'twitch_id'),
+        ('steam_id', 'steam_id'),
+        ('total_views', 'total_views'),
+    ], ('get_date', 'twitch_id', 'steam_id'), 'steam_id'),
+    ('steam_active_users', [
+        ('steam_id', 'steam_id'),
+        ('get_date', 'get_date'),
+        ('active_user', 'active_user'),
+        ('active_chat_user', 'active_chat_user'),
+    ], ('steam_id', 'get_date'), 'steam_id'),
+]
+
+
+def build_records(game, current_date):
+    # 1ゲーム分のデータから、3つのテーブルに挿入するレコードを作る
+    steam_id = game.get('steam_id')
+    twitch_id = game.get('twitch_id')
+    game_title = game.get('game_title')
+
+    steam_game_data_record = {
+        'steam_id': steam_id,
+        'twitch_id': twitch_id,
+        'game_title': game_title,
+        'genres': game.get('genres', []),
+        'webpage_url': game.get('webpage_url'),
+        'img_url': game.get('img_url'),
+        'price': game.get('price'),
+        'sale_price': game.get('sale_price'),
+        'is_single_player': game.get('is_single_player'),
+        'is_multi_player': game.get('is_multi_player'),
+        'is_device_windows': game.get('is_device_windows'),
+        'is_device_mac': game.get('is_device_mac'),
+        'play_time': game.get('play_time'),
+        'review_text': Json(game.get('review_text', {})),
+        'difficulty': game.get('difficulty'),
+        'graphics': game.get('graphics'),
+        'story': game.get('story'),
+        'music': game.get('music'),
+        'developer_name': game.get('developer_name'),
+        'short_details': game.get('short_details'),
+        'release_date': game.get('release_date'),
+        'tags': game.get('tags', [])
+    }
+
+    game_views_record = {
+        'get_date': current_date,
+        'game_title': game_title,
+        'twitch_id': twitch_id,
+        'steam_id': steam_id,
+        'total_views': game.get('total_views')
+    }
+
+    steam_active_users_record = {
+        'steam_id': steam_id,
+        'get_date': current_date,
+        'active_user': game.get('active_user'),
+        'active_chat_user': game.get('active_chat_user')
+    }
+
+    return steam_game_data_record, game_views_record, steam_active_users_record
+
+
+def steam_id_key(value):
+    # 入力のSteam IDは文字列、DBから読んだものは整数のため、整数にそろえて比較する
     try:
-        conn = psycopg2.connect(
-            host=PGHOST,
-            port=PGPORT,
-            dbname=PGDATABASE,
-            user=PGUSER,
-            password=PGPASSWORD
-        )
-        cursor = conn.cursor()
-        print("PostgreSQLに正常に接続しました。")
-    except Exception as e:
-        print(f"PostgreSQLへの接続に失敗しました: {e}")
-        sys.exit(1)
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Quarantine:
+    # 挿入できなかったゲームを元のデータとエラー内容とともにファイルへ退避する
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        self.steam_ids = set()
+
+    def add(self, table, game, error):
+        self.steam_ids.add(steam_id_key(game.get('steam_id')))
+        self.entries.append({'table': table, 'error': str(error).strip(), 'game': game})
 
-    json_file_path = 'all_top_games_data.json'
+    def save(self):
+        if not self.entries:
+            return
+        with open(self.path, 'w', encoding='utf-8') as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+        print(f"挿入できなかった {len(self.entries)} 件を '{self.path}' に退避しました。")
 
-    # JSONファイルの読み込み
+
+def run_in_savepoint(cursor, func):
+    # セーブポイント内で実行し、失敗した場合はその処理だけを取り消す（それまでの行は残る）
+    cursor.execute("SAVEPOINT bulk_step")
     try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            all_top_games_data = json.load(f)
-        print(f"{json_file_path} を正常に読み込みました。")
-    except Exception as e:
-        print(f"{json_file_path} の読み込みに失敗しました: {e}")
-        cursor.close()
-        conn.close()
-        sys.exit(1)
+        func()
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT bulk_step")
+        return e
+    cursor.execute("RELEASE SAVEPOINT bulk_step")
+    return None
 
-    # 1. steam_game_data テーブル
-    insert_steam_game_data = """
-    INSERT INTO steam_game_data (
-        steam_game_id,
-        twitch_game_id,
-        game_title,
-        genres,
-        webpage_url,
-        img_url,
-        price,
-        sale_price,
-        is_single_player,
-        is_multi_player,
-        is_device_windows,
-        is_device_mac,
-        play_time,
-        review_text,
-        difficulty,
-        graphics,
-        story,
-        music,
-        developer_name,
-        short_details,
-        release_date,
-        tags
-    ) VALUES (
-        %(steam_id)s,
-        %(twitch_id)s,
-        %(game_title)s,
-        %(genres)s,
-        %(webpage_url)s,
-        %(img_url)s,
-        %(price)s,
-        %(sale_price)s,
-        %(is_single_player)s,
-        %(is_multi_player)s,
-        %(is_device_windows)s,
-        %(is_device_mac)s,
-        %(play_time)s,
-        %(review_text)s,
-        %(difficulty)s,
-        %(graphics)s,
-        %(story)s,
-        %(music)s,
-        %(developer_name)s,
-        %(short_details)s,
-        %(release_date)s,
-        %(tags)s
-    )
-    ON CONFLICT (steam_game_id) DO UPDATE SET
-        twitch_game_id = EXCLUDED.twitch_game_id,
-        game_title = EXCLUDED.game_title,
-        genres = EXCLUDED.genres,
-        webpage_url = EXCLUDED.webpage_url,
-        img_url = EXCLUDED.img_url,
-        price = EXCLUDED.price,
-        sale_price = EXCLUDED.sale_price,
-        is_single_player = EXCLUDED.is_single_player,
-        is_multi_player = EXCLUDED.is_multi_player,
-        is_device_windows = EXCLUDED.is_device_windows,
-        is_device_mac = EXCLUDED.is_device_mac,
-        play_time = EXCLUDED.play_time,
-        review_text = EXCLUDED.review_text,
-        difficulty = EXCLUDED.difficulty,
-        graphics = EXCLUDED.graphics,
-        story = EXCLUDED.story,
-        music = EXCLUDED.music,
-        developer_name = EXCLUDED.developer_name,
-        short_details = EXCLUDED.short_details,
-        release_date = EXCLUDED.release_date,
-        tags = EXCLUDED.tags;
-    """
 
-    # 2. game_views テーブル
-    insert_game_views = """
-    INSERT INTO game_views (
-        get_date,
-        game_title,
-        twitch_id,
-        steam_id,
-        total_views
-    ) VALUES (
-        %(get_date)s,
-        %(game_title)s,
-        %(twitch_id)s,
-        %(steam_id)s,
-        %(total_views)s
+def create_stage(cursor, table):
+    stage = f"stage_{table}"
+    cursor.execute(f"CREATE TEMP TABLE {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+    return stage
+
+
+def stage_rows(cursor, table, stage, columns, rows, quarantine):
+    # 一時テーブルに複数行のINSERTでまとめて送る
+    # 失敗したページは1行ずつ送り直し、挿入できない行だけを退避する
+    column_list = ', '.join(column for column, _ in columns)
+    insert_stage = f"INSERT INTO {stage} ({column_list}) VALUES %s"
+
+    def values(record):
+        return tuple(record[key] for _, key in columns)
+
+    error = run_in_savepoint(
+        cursor, lambda: execute_values(cursor, insert_stage, [values(record) for _, record in rows], page_size=len(rows))
     )
-    ON CONFLICT (get_date, twitch_id, steam_id) DO UPDATE SET
-        total_views = EXCLUDED.total_views;
-    """
+    if error is None:
+        return
+    for game, record in rows:
+        error = run_in_savepoint(cursor, lambda: cursor.execute(
+            f"INSERT INTO {stage} ({column_list}) VALUES ({', '.join(['%s'] * len(columns))})", values(record)
+        ))
+        if error is not None:
+            quarantine.add(table, game, error)
 
-    # 3. steam_active_users テーブル
-    insert_steam_active_users = """
-    INSERT INTO steam_active_users (
-        steam_id,
-        get_date,
-        active_user,
-        active_chat_user
-    ) VALUES (
-        %(steam_id)s,
-        %(get_date)s,
-        %(active_user)s,
-        %(active_chat_user)s
+
+def merge_stage(cursor, table, columns, conflict_columns, key_column, stage, quarantine):
+    # ステージングテーブルから本テーブルへ1回の INSERT ... ON CONFLICT で反映する
+    # 先に退避したゲームは、元の処理と同じく後続のテーブルにも挿入しない
+    # 整数に変換できないIDの行はステージングテーブルに入らないため、削除の対象にしない
+    steam_ids = [steam_id for steam_id in quarantine.steam_ids if steam_id is not None]
+    if steam_ids:
+        cursor.execute(f"DELETE FROM {stage} WHERE {key_column} = ANY(%s::bigint[])", (steam_ids,))
+
+    column_list = ', '.join(column for column, _ in columns)
+    conflict_list = ', '.join(conflict_columns)
+    updates = ', '.join(
+        f"{column} = EXCLUDED.{column}" for column, _ in columns if column not in conflict_columns
     )
-    ON CONFLICT (steam_id, get_date) DO UPDATE SET
-        active_user = EXCLUDED.active_user,
-        active_chat_user = EXCLUDED.active_chat_user;
+    # 同じキーの行が複数ある場合は、元の処理と同じく後から来た行を採用する
+    merge_sql = f"""
+        INSERT INTO {table} ({column_list})
+        SELECT DISTINCT ON ({conflict_list}) {column_list} FROM {stage} {{where}}
+        ORDER BY {conflict_list}, ctid DESC
+        ON CONFLICT ({conflict_list}) DO UPDATE SET {updates}
     """
+    error = run_in_savepoint(cursor, lambda: cursor.execute(merge_sql.format(where='')))
+    if error is None:
+        return
 
-    # 現在の日付を取得（YYYY-MM-DD形式）
-    current_date = datetime.now().strftime('%Y-%m-%d')
+    # まとめて反映できなかった場合は、ゲームごとに反映して原因のゲームだけを退避する
+    cursor.execute(f"SELECT DISTINCT {key_column} FROM {stage}")
+    for (steam_id,) in cursor.fetchall():
+        error = run_in_savepoint(cursor, lambda: cursor.execute(
+            merge_sql.format(where=f"WHERE {key_column} = %(steam_id)s"), {'steam_id': steam_id}
+        ))
+        if error is not None:
+            # 入力全体をメモリに持たないため、ここで退避するのはSteam IDだけ
+            quarantine.add(table, {'steam_id': steam_id}, error)
 
-    # データの挿入
+
+def bulk_load(conn, games, current_date, quarantine_path=DEFAULT_QUARANTINE_PATH):
+    # 入力をページ単位で一時テーブルに送り、最後にテーブルごとに1回の集合演算で反映する
+    # （入力は遅延読み込みのイテレータでもよく、メモリ使用量はページの大きさで決まる）
+    quarantine = Quarantine(quarantine_path)
+    steam_ids = set()
+    games = iter(games)
+    cursor = conn.cursor()
     try:
-        for game in tqdm(all_top_games_data, desc="Inserting data into PostgreSQL"):
-            # データの準備
-            steam_id = game.get('steam_id')
-            twitch_id = game.get('twitch_id')
-            game_title = game.get('game_title')
-            genres = game.get('genres', [])
-            webpage_url = game.get('webpage_url')
-            img_url = game.get('img_url')
-            price = game.get('price')
-            sale_price = game.get('sale_price')
-            is_single_player = game.get('is_single_player')
-            is_multi_player = game.get('is_multi_player')
-            is_device_windows = game.get('is_device_windows')
-            is_device_mac = game.get('is_device_mac')
-            play_time = game.get('play_time')
-            review_text = game.get('review_text', {})
-            difficulty = game.get('difficulty')
-            graphics = game.get('graphics')
-            story = game.get('story')
-            music = game.get('music')
-            developer_name = game.get('developer_name')
-            short_details = game.get('short_details')
-            release_date = game.get('release_date')
-            tags = game.get('tags', [])
-            total_views = game.get('total_views')
-            active_user = game.get('active_user')
-            active_chat_user = game.get('active_chat_user')
-
-            # steam_game_data テーブルへの挿入
-            steam_game_data_record = {
-                'steam_id': steam_id,
-                'twitch_id': twitch_id,
-                'game_title': game_title,
-                'genres': genres,
-                'webpage_url': webpage_url,
-                'img_url': img_url,
-                'price': price,
-                'sale_price': sale_price,
-                'is_single_player': is_single_player,
-                'is_multi_player': is_multi_player,
-                'is_device_windows': is_device_windows,
-                'is_device_mac': is_device_mac,
-                'play_time': play_time,
-                'review_text': Json(review_text),
-                'difficulty': difficulty,
-                'graphics': graphics,
-                'story': story,
-                'music': music,
-                'developer_name': developer_name,
-                'short_details': short_details,
-                'release_date': release_date,
-                'tags': tags
-            }
+        stages = [create_stage(cursor, table) for table, _, _, _ in BULK_TABLES]
+        while True:
+            page = list(itertools.islice(games, BULK_PAGE_SIZE))
+            if not page:
+                break
+            table_rows = [[] for _ in BULK_TABLES]
+            for game in page:
+                steam_ids.add(steam_id_key(game.get('steam_id')))
+                for rows, record in zip(table_rows, build_records(game, current_date)):
+                    rows.append((game, record))
+            for (table, columns, _, _), stage, rows in zip(BULK_TABLES, stages, table_rows):
+                stage_rows(cursor, table, stage, columns, rows, quarantine)
 
-            try:
-                cursor.execute(insert_steam_game_data, steam_game_data_record)
-            except Exception as e:
-                print(f"steam_game_data テーブルへの挿入に失敗しました (Steam ID: {steam_id}): {e}")
-                conn.rollback()
-                continue
+        for (table, columns, conflict_columns, key_column), stage in zip(BULK_TABLES, stages):
+            merge_stage(cursor, table, columns, conflict_columns, key_column, stage, quarantine)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    quarantine.save()
+    return len(steam_ids - quarantine.steam_ids)
 
-            # game_views テーブルへの挿入
-            game_views_record = {
-                'get_date': current_date,
-                'game_title': game_title,
-                'twitch_id': twitch_id,
-                'steam_id': steam_id,
-                'total_views': total_views
-            }
 
-            try:
-                cursor.execute(insert_game_views, game_views_record)
-            except Exception as e:
-                print(f"game_views テーブルへの挿入に失敗しました (Steam ID: {steam_id}): {e}")
-                conn.rollback()
-                continue
+def load_row_by_row(conn, cursor, all_top_games_data, current_date):
+    for game in tqdm(all_top_games_data, desc="Inserting data into PostgreSQL"):
+        steam_id = game.get('steam_id')
+        steam_game_data_record, game_views_record, steam_active_users_record = build_records(game, current_date)
+
+        # 失敗したゲームだけを取り消せるよう、ゲームごとにセーブポイントを置く
+        cursor.execute("SAVEPOINT game")
+
+        # steam_game_data テーブルへの挿入
+        try:
+            cursor.execute(INSERT_STEAM_GAME_DATA, steam_game_data_record)
+        except Exception as e:
+            print(f"steam_game_data テーブルへの挿入に失敗しました (Steam ID: {steam_id}): {e}")
+            cursor.execute("ROLLBACK TO SAVEPOINT game")
+            continue
+
+        # game_views テーブルへの挿入
+        try:
+            cursor.execute(INSERT_GAME_VIEWS, game_views_record)
+        except Exception as e:
+            print(f"game_views テーブルへの挿入に失敗しました (Steam ID: {steam_id}): {e}")
+            cursor.execute("ROLLBACK TO SAVEPOINT game")
+            continue
 
-            # steam_active_users テーブルへの挿入
-            steam_active_users_record = {
-                'steam_id': steam_id,
-                'get_date': current_date,
-                'active_user': active_user,
-                'active_chat_user': active_chat_user
-            }
+        # steam_active_users テーブルへの挿入
+        try:
+            cursor.execute(INSERT_STEAM_ACTIVE_USERS, steam_active_users_record)
+        except Exception as e:
+            print(f"steam_active_users テーブルへの挿入に失敗しました (Steam ID: {steam_id}): {e}")
+            cursor.execute("ROLLBACK TO SAVEPOINT game")
+            continue
 
+        cursor.execute("RELEASE SAVEPOINT game")
+
+
+def main(json_file_path='all_top_games_data.json', bulk=True, quarantine_path=DEFAULT_QUARANTINE_PATH, follow=False):
+    # JSONファイルの読み込み（NDJSONの場合は1行ずつ遅延して読み込む）
+    try:
+        if is_ndjson_path(json_file_path):
+            if not follow and not os.path.exists(json_file_path):
+                raise FileNotFoundError(json_file_path)
+            all_top_games_data = iter_ndjson(json_file_path, follow=follow)
+        else:
+            with open(json_file_path, 'r', encoding='utf-8') as f:
+                all_top_games_data = json.load(f)
+        print(f"{json_file_path} を正常に読み込みました。")
+    except Exception as e:
+        print(f"{json_file_path} の読み込みに失敗しました: {e}")
+        sys.exit(1)
+
+    # 現在の日付を取得（YYYY-MM-DD形式）
+    current_date = datetime.now().strftime('%Y-%m-%d')
+
+    # 共有のコネクションプールから PostgreSQL の接続を借りる
+    try:
+        with db.connection() as conn:
+            print("PostgreSQLに正常に接続しました。")
+            # データの挿入
             try:
-                cursor.execute(insert_steam_active_users, steam_active_users_record)
+                if bulk:
+                    loaded = bulk_load(conn, all_top_games_data, current_date, quarantine_path)
+                    print(f"{loaded} 件のゲームを一括で挿入/更新しました。")
+                else:
+                    with conn.cursor() as cursor:
+                        load_row_by_row(conn, cursor, all_top_games_data, current_date)
+                    # 変更をコミット
+                    conn.commit()
+                    print("全てのデータを正常に挿入/更新しました。")
+
             except Exception as e:
-                print(f"steam_active_users テーブルへの挿入に失敗しました (Steam ID: {steam_id}): {e}")
+                print(f"データの挿入中にエラーが発生しました: {e}")
                 conn.rollback()
-                continue
-
-        # 変更をコミット
-        conn.commit()
-        print("全てのデータを正常に挿入/更新しました。")
+    except psycopg2.Error as e:
+        print(f"PostgreSQLへの接続に失敗しました: {e}")
+        sys.exit(1)
 
-    except Exception as e:
-        print(f"データの挿入中にエラーが発生しました: {e}")
-        conn.rollback()
-    finally:
-        # 接続を閉じる
-        cursor.close()
-        conn.close()
-        print("PostgreSQLの接続を閉じました。")
+def parse_args():
+    parser = argparse.ArgumentParser(description="解析済みのゲームデータをPostgreSQLに挿入します。")
+    parser.add_argument('json_file', nargs='?', default='all_top_games_data.json',
+                        help="挿入するJSONファイル（拡張子が .ndjson / .jsonl の場合は1行1ゲームとして読み込む）")
+    parser.add_argument('--row-by-row', action='store_true',
+                        help="一括モードを使わず、1ゲームずつ挿入する")
+    parser.add_argument('--quarantine', default=DEFAULT_QUARANTINE_PATH,
+                        help="一括モードで挿入できなかったゲームを退避するファイル")
+    parser.add_argument('--follow', action='store_true',
+                        help="NDJSONの入力を、前段が書き終える（.doneマーカーができる）まで追従して読み込む")
+    return parser.parse_args()
 
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    main(json_file_path=args.json_file, bulk=not args.row_by_row, quarantine_path=args.quarantine,
+         follow=args.follow)
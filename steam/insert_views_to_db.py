@@ -1,53 +1,120 @@
-import json
-import psycopg2
+import csv
+import io
 import sys
-import os
 import datetime
+import time
 
 from dotenv import load_dotenv
 # load_dotenv()
 
-def insert_views_to_db(json_file, db_host, db_port, db_name, db_user, db_password):
+import db
+from json_stream import iter_json_array
+
+# COPYで1回に送る行数と、フィードを読み込む単位（バイト）
+COPY_BATCH_SIZE = 5000
+READ_CHUNK_SIZE = 1 << 20
+
+STEAM_DATA_COLUMNS = [
+    'steam_game_id', 'twitch_game_id', 'game_title', 'webpage_url', 'img_url', 'price',
+    'is_single_player', 'is_multi_player', 'is_device_windows', 'is_device_mac'
+]
+STEAM_DATA_GENRES_COLUMNS = ['steam_game_id', 'genre_id']
+GAME_VIEWS_COLUMNS = ['get_date', 'game_title', 'twitch_id', 'steam_id', 'total_views']
+
+
+def iter_feed(json_file):
+    # クロール結果のJSONを一度に読み込まず、アイテムを1件ずつ取り出す
+    with open(json_file, 'rb') as f:
+        yield from iter_json_array(iter(lambda: f.read(READ_CHUNK_SIZE), b''))
+
+
+class CopyBuffer:
+    # 行をCSVとしてためておき、一定件数ごとに COPY でステージングテーブルへ送る
+    def __init__(self, cur, table, columns):
+        self.cur = cur
+        self.sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = 0
+        self.rows = 0
+
+    def add(self, row):
+        self.writer.writerow(row)
+        self.pending += 1
+        if self.pending >= COPY_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.buffer.seek(0)
+        self.cur.copy_expert(self.sql, self.buffer)
+        self.rows += self.pending
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = 0
+
+
+def insert_views_to_db(json_file):
+    # クロール時に PostgresPipeline（PG_PIPELINE_ENABLED）で書き込んだ場合は、同じ行が二重に入るため実行しない
+    started = time.perf_counter()
     try:
-        connect = psycopg2.connect(
-            host=db_host,
-            user=db_user,
-            password=db_password,
-            dbname=db_name,
-            port=db_port
-        )
-        cur = connect.cursor()
-
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        steam_data_values = []
-        steam_data_genres_values = []
-        game_views_values = []
-
-        for item in data:
-            # Prepare values for steam_data table
-            steam_data_values.append((
+        with db.connection() as connect:
+            copied, steam_data, steam_data_genres, game_views = load_views(connect, json_file)
+
+        finished = time.perf_counter()
+        rows = steam_data.rows + steam_data_genres.rows + game_views.rows
+        elapsed = finished - started
+        print(f"Loaded {rows} rows ({steam_data.rows} games) in {elapsed:.2f}s "
+              f"({rows / elapsed if elapsed > 0 else 0:.0f} rows/sec; "
+              f"copy {copied - started:.2f}s, merge {finished - copied:.2f}s)")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+def load_views(connect, json_file):
+    with connect.cursor() as cur:
+        # 実行ごとに1つの取得時刻をすべての行で使う
+        snapshot = datetime.datetime.now()
+
+        # 一時テーブルはWALに書かれず、トランザクションの終了時に消える
+        cur.execute("""
+            CREATE TEMP TABLE stage_steam_data (LIKE steam_data INCLUDING DEFAULTS) ON COMMIT DROP;
+            CREATE TEMP TABLE stage_steam_data_genres (LIKE steam_data_genres INCLUDING DEFAULTS) ON COMMIT DROP;
+            CREATE TEMP TABLE stage_game_views (LIKE game_views INCLUDING DEFAULTS) ON COMMIT DROP;
+        """)
+
+        steam_data = CopyBuffer(cur, 'stage_steam_data', STEAM_DATA_COLUMNS)
+        steam_data_genres = CopyBuffer(cur, 'stage_steam_data_genres', STEAM_DATA_GENRES_COLUMNS)
+        game_views = CopyBuffer(cur, 'stage_game_views', GAME_VIEWS_COLUMNS)
+
+        for item in iter_feed(json_file):
+            steam_data.add((
                 item['steam_id'], item['twitch_id'], item['game_title'], item['webpage_url'],
                 item['img_url'], item['price'], item['is_single_player'], item['is_multi_player'],
                 item['is_device_windows'], item['is_device_mac']
             ))
-
-            # Prepare values for steam_data_genres table
             for genre in item['genres']:
-                steam_data_genres_values.append((item['steam_id'], genre['id']))
-
-            # Prepare values for game_views table
-            game_views_values.append((
-                datetime.datetime.now(), item['game_title'], item['twitch_id'], item['steam_id'], item['total_views']
+                steam_data_genres.add((item['steam_id'], genre['id']))
+            game_views.add((
+                snapshot.isoformat(), item['game_title'], item['twitch_id'], item['steam_id'], item['total_views']
             ))
 
+        for buffer in (steam_data, steam_data_genres, game_views):
+            buffer.flush()
+        copied = time.perf_counter()
+
         # Insert or update steam_data table
-        cur.executemany("""
+        # 同じゲームが複数回現れた場合は、後の行を採用する
+        cur.execute("""
             INSERT INTO steam_data (
                 steam_game_id, twitch_game_id, game_title, webpage_url, img_url, price,
                 is_single_player, is_multi_player, is_device_windows, is_device_mac
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            )
+            SELECT DISTINCT ON (steam_game_id)
+                steam_game_id, twitch_game_id, game_title, webpage_url, img_url, price,
+                is_single_player, is_multi_player, is_device_windows, is_device_mac
+            FROM stage_steam_data
+            ORDER BY steam_game_id, ctid DESC
             ON CONFLICT (steam_game_id) DO UPDATE SET
                 twitch_game_id = EXCLUDED.twitch_game_id,
                 game_title = EXCLUDED.game_title,
@@ -58,37 +125,29 @@ def insert_views_to_db(json_file, db_host, db_port, db_name, db_user, db_passwor
                 is_multi_player = EXCLUDED.is_multi_player,
                 is_device_windows = EXCLUDED.is_device_windows,
                 is_device_mac = EXCLUDED.is_device_mac
-        """, steam_data_values)
+        """)
 
         # Insert or update steam_data_genres table
-        cur.executemany("""
+        cur.execute("""
             INSERT INTO steam_data_genres (steam_game_id, genre_id)
-            VALUES (%s, %s)
+            SELECT DISTINCT steam_game_id, genre_id FROM stage_steam_data_genres
             ON CONFLICT (steam_game_id, genre_id) DO NOTHING
-        """, steam_data_genres_values)
+        """)
 
         # Insert data into game_views table
-        cur.executemany("""
+        cur.execute("""
             INSERT INTO game_views (get_date, game_title, twitch_id, steam_id, total_views)
-            VALUES (%s, %s, %s, %s, %s)
-        """, game_views_values)
+            SELECT get_date, game_title, twitch_id, steam_id, total_views FROM stage_game_views
+        """)
 
         connect.commit()
-        cur.close()
-        connect.close()
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    return copied, steam_data, steam_data_genres, game_views
 
 if __name__ == "__main__":
     json_file = 'twitch_top_games.json'
-    PGHOST = os.getenv('PGHOST')
-    PGPORT = os.getenv('PGPORT')
-    PGDATABASE = os.getenv('PGDATABASE')
-    PGUSER = os.getenv('PGUSER')
-    PGPASSWORD = os.getenv('PGPASSWORD')
 
-    if not all([PGHOST, PGPORT, PGDATABASE, PGUSER, PGPASSWORD]):
+    if not db.is_configured():
         print("Database connection information is missing.")
         sys.exit(1)
 
-    insert_views_to_db(json_file, PGHOST, PGPORT, PGDATABASE, PGUSER, PGPASSWORD)
+    insert_views_to_db(json_file)
@@ -0,0 +1,285 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# HTTPの応答時間のヒストグラムの区切り（秒）。最後に +Inf の区間が続く
+HTTP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 処理量の比率として出力するもの（名前: (カウンター, 段階)）
+RATES = {
+    'tokens_per_second': ('tokens', 'tokenize'),
+}
+PROMETHEUS_PREFIX = 'steam_pipeline'
+
+
+def metrics_path_for(output_file):
+    return output_file + '.metrics.json'
+
+
+def _new_stage():
+    return {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'peak_memory_bytes': None}
+
+
+def _new_host():
+    return {'count': 0, 'seconds': 0.0, 'buckets': [0] * (len(HTTP_BUCKETS) + 1), 'statuses': {}}
+
+
+class Metrics:
+    # 段階ごとの時間・回数・ピークメモリ、カウンター、ホストごとのHTTP応答時間を集計する（スレッドセーフ）
+    # 段階の時間は各スレッドでの時間の和なので、並列に実行される段階は経過時間より長くなることがある
+    def __init__(self, pipeline=None):
+        self.pipeline = pipeline
+        self.trace_memory = False
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.http = {}
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def start(self, pipeline, trace_memory=False):
+        self.pipeline = pipeline
+        self.started = time.time()
+        if trace_memory:
+            self.enable_memory_tracing()
+
+    def enable_memory_tracing(self):
+        # tracemalloc は割り当てのたびに記録するため遅くなる。指定された場合だけ有効にする
+        self.trace_memory = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            # ピークのリセットはプロセス全体に効くため、他の段階が実行中でないときだけ行う
+            # （並列に実行される段階のピークは、その段階の実行中のプロセス全体のピークになる）
+            with self._lock:
+                if self._active == 0:
+                    tracemalloc.reset_peak()
+                self._active += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1] if tracing else None
+            with self._lock:
+                if tracing:
+                    self._active -= 1
+                record = self.stages.setdefault(name, _new_stage())
+                record['count'] += 1
+                record['seconds'] += elapsed
+                record['max_seconds'] = max(record['max_seconds'], elapsed)
+                if peak is not None:
+                    record['peak_memory_bytes'] = max(record['peak_memory_bytes'] or 0, peak)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe_http(self, host, seconds, status):
+        index = len(HTTP_BUCKETS)
+        for i, bound in enumerate(HTTP_BUCKETS):
+            if seconds <= bound:
+                index = i
+                break
+        status = str(status)
+        with self._lock:
+            record = self.http.setdefault(host, _new_host())
+            record['count'] += 1
+            record['seconds'] += seconds
+            record['buckets'][index] += 1
+            record['statuses'][status] = record['statuses'].get(status, 0) + 1
+
+    def drain(self):
+        # ワーカープロセスで集計した分を親プロセスに渡すため、集計結果を取り出してリセットする
+        with self._lock:
+            snapshot = {'stages': self.stages, 'counters': self.counters, 'http': self.http}
+            self.stages = {}
+            self.counters = {}
+            self.http = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        if not snapshot:
+            return
+        with self._lock:
+            for name, other in snapshot['stages'].items():
+                record = self.stages.setdefault(name, _new_stage())
+                record['count'] += other['count']
+                record['seconds'] += other['seconds']
+                record['max_seconds'] = max(record['max_seconds'], other['max_seconds'])
+                if other['peak_memory_bytes'] is not None:
+                    record['peak_memory_bytes'] = max(record['peak_memory_bytes'] or 0, other['peak_memory_bytes'])
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for host, other in snapshot['http'].items():
+                record = self.http.setdefault(host, _new_host())
+                record['count'] += other['count']
+                record['seconds'] += other['seconds']
+                record['buckets'] = [a + b for a, b in zip(record['buckets'], other['buckets'])]
+                for status, count in other['statuses'].items():
+                    record['statuses'][status] = record['statuses'].get(status, 0) + count
+
+    def summary(self):
+        with self._lock:
+            stages = {
+                name: dict(record, mean_seconds=record['seconds'] / record['count'] if record['count'] else 0.0)
+                for name, record in self.stages.items()
+            }
+            counters = dict(self.counters)
+            http = {}
+            for host, record in self.http.items():
+                http[host] = {
+                    'count': record['count'],
+                    'seconds': record['seconds'],
+                    'mean_seconds': record['seconds'] / record['count'] if record['count'] else 0.0,
+                    # 区間ごとの件数（le: 上限）
+                    'buckets': {
+                        str(bound): count
+                        for bound, count in zip(list(HTTP_BUCKETS) + ['+Inf'], record['buckets'])
+                    },
+                    'statuses': dict(record['statuses']),
+                }
+        rates = {}
+        for rate, (counter, stage) in RATES.items():
+            seconds = stages.get(stage, {}).get('seconds', 0.0)
+            if counter in counters and seconds > 0:
+                rates[rate] = counters[counter] / seconds
+        return {
+            'pipeline': self.pipeline,
+            'started_at': self.started,
+            'elapsed_seconds': time.time() - self.started,
+            'trace_memory': self.trace_memory,
+            'stages': stages,
+            'counters': counters,
+            'rates': rates,
+            'http': http,
+        }
+
+    def write_json(self, path, summary=None):
+        summary = summary or self.summary()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    def write_prometheus(self, path, summary=None):
+        # node_exporter の textfile collector が書き込み途中のファイルを読まないよう、置き換えで書き出す
+        summary = summary or self.summary()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(format_prometheus(summary))
+        os.replace(tmp_path, path)
+
+    def log_summary(self, summary=None):
+        summary = summary or self.summary()
+        print(f"段階ごとの処理時間（{summary['elapsed_seconds']:.1f}秒の実行）:")
+        for name, record in sorted(summary['stages'].items(), key=lambda item: -item[1]['seconds']):
+            line = (f"  {name}: {record['seconds']:.2f}秒 / {record['count']}回"
+                    f"（平均 {record['mean_seconds'] * 1000:.1f}ms, 最大 {record['max_seconds'] * 1000:.1f}ms）")
+            if record['peak_memory_bytes'] is not None:
+                line += f" ピークメモリ {record['peak_memory_bytes'] / 1024 / 1024:.1f}MB"
+            print(line)
+        for rate, value in summary['rates'].items():
+            print(f"  {rate}: {value:.0f}")
+
+
+def _labels(**labels):
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def format_prometheus(summary):
+    pipeline = summary['pipeline'] or ''
+    prefix = PROMETHEUS_PREFIX
+    lines = []
+
+    def metric(name, metric_type, help_text, samples):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+        for suffix, labels, value in samples:
+            lines.append(f"{prefix}_{name}{suffix}{_labels(pipeline=pipeline, **labels)} {value}")
+
+    stages = sorted(summary['stages'].items())
+    metric('run_seconds', 'gauge', 'Wall-clock duration of the run.',
+           [('', {}, summary['elapsed_seconds'])])
+    metric('stage_seconds_total', 'counter', 'Time spent in each stage, summed over threads.',
+           [('', {'stage': name}, record['seconds']) for name, record in stages])
+    metric('stage_calls_total', 'counter', 'Number of times each stage ran.',
+           [('', {'stage': name}, record['count']) for name, record in stages])
+    metric('stage_max_seconds', 'gauge', 'Longest single run of each stage.',
+           [('', {'stage': name}, record['max_seconds']) for name, record in stages])
+    memory = [('', {'stage': name}, record['peak_memory_bytes'])
+              for name, record in stages if record['peak_memory_bytes'] is not None]
+    if memory:
+        metric('stage_peak_memory_bytes', 'gauge', 'Peak traced memory while each stage ran.', memory)
+    metric('events_total', 'counter', 'Pipeline counters.',
+           [('', {'name': name}, value) for name, value in sorted(summary['counters'].items())])
+    metric('rate', 'gauge', 'Throughput derived from counters and stage time.',
+           [('', {'name': name}, value) for name, value in sorted(summary['rates'].items())])
+
+    samples = []
+    for host, record in sorted(summary['http'].items()):
+        cumulative = 0
+        for bound, count in record['buckets'].items():
+            cumulative += count
+            samples.append(('_bucket', {'host': host, 'le': bound}, cumulative))
+        samples.append(('_sum', {'host': host}, record['seconds']))
+        samples.append(('_count', {'host': host}, record['count']))
+    metric('http_request_duration_seconds', 'histogram', 'HTTP request latency per host.', samples)
+    metric('http_responses_total', 'counter', 'HTTP responses per host and status.',
+           [('', {'host': host, 'status': status}, count)
+            for host, record in sorted(summary['http'].items())
+            for status, count in sorted(record['statuses'].items())])
+    return '\n'.join(lines) + '\n'
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+    return _metrics
+
+
+def stage(name):
+    return get_metrics().stage(name)
+
+
+def increment(name, value=1):
+    get_metrics().increment(name, value)
+
+
+def observe_http(host, seconds, status):
+    get_metrics().observe_http(host, seconds, status)
+
+
+def start_run(pipeline, trace_memory=False):
+    get_metrics().start(pipeline, trace_memory=trace_memory)
+
+
+def finish_run(metrics_path=None, prometheus_path=None):
+    # 実行の最後に集計結果を表示し、JSON（と指定された場合はPrometheusのテキスト形式）で書き出す
+    metrics = get_metrics()
+    summary = metrics.summary()
+    metrics.log_summary(summary)
+    try:
+        if metrics_path:
+            metrics.write_json(metrics_path, summary)
+            print(f"計測結果を '{metrics_path}' に保存しました。")
+        if prometheus_path:
+            metrics.write_prometheus(prometheus_path, summary)
+            print(f"Prometheus形式の計測結果を '{prometheus_path}' に保存しました。")
+    except Exception as e:
+        print(f"計測結果の保存に失敗しました: {e}")
+    return summary
@@ -0,0 +1,159 @@
+import codecs
+import json
+import os
+import re
+import time
+
+_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json_array(chunks, key=None):
+    # チャンク単位で受け取ったJSONから、配列の要素を1つずつ取り出す
+    # （keyを指定した場合は、そのキーの値になっている配列を対象にする）
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    exhausted = False
+
+    def read_more():
+        nonlocal buffer, exhausted
+        for chunk in chunks:
+            if isinstance(chunk, bytes):
+                chunk = text_decoder.decode(chunk)
+            if chunk:
+                buffer += chunk
+                return True
+        exhausted = True
+        buffer += text_decoder.decode(b'', final=True)
+        return False
+
+    # 配列の開始位置を探す
+    marker = f'"{key}"' if key is not None else None
+    while True:
+        if marker is not None:
+            position = buffer.find(marker)
+            if position >= 0:
+                rest = buffer[position + len(marker):]
+                after = rest.lstrip()
+                if after.startswith(':'):
+                    value = after[1:].lstrip()
+                    if value.startswith('['):
+                        buffer = value[1:]
+                        break
+                    if value:
+                        # 配列ではない値だった場合は、次に現れる同じキーを探す
+                        buffer = rest
+                        continue
+                elif after:
+                    # キーではなく値として現れた文字列だった場合
+                    buffer = rest
+                    continue
+        else:
+            position = buffer.find('[')
+            if position >= 0:
+                buffer = buffer[position + 1:]
+                break
+        if exhausted:
+            return
+        read_more()
+
+    # 要素ごとに文字列を切り出さず、読み込み位置だけを進める
+    position = 0
+    while True:
+        position = _SEPARATORS.match(buffer, position).end()
+        if position == len(buffer):
+            buffer = ''
+            position = 0
+            if exhausted or not read_more():
+                return
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # 要素が途中で切れている場合は続きを読み込んでからやり直す
+            buffer = buffer[position:]
+            position = 0
+            if exhausted or not read_more():
+                raise
+            continue
+        if end == len(buffer) and not exhausted:
+            # 数値などは途中で切れていても読めてしまうため、続きを確認する
+            buffer = buffer[position:]
+            position = 0
+            read_more()
+            continue
+        position = end
+        yield item
+
+
+def is_ndjson_path(path):
+    return path.endswith(('.ndjson', '.jsonl'))
+
+
+def done_marker_path(path):
+    return path + '.done'
+
+
+class NdjsonWriter:
+    # 1行に1件ずつJSONを書き出し、書くたびにフラッシュする（後段の処理が完了を待たずに読み始められる）
+    # 閉じると「.done」マーカーを作り、後段の追従読み込みに書き込みの終了を知らせる
+    def __init__(self, path, append=False):
+        self.path = path
+        marker = done_marker_path(path)
+        if os.path.exists(marker):
+            os.remove(marker)
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.close()
+        with open(done_marker_path(self.path), 'w', encoding='utf-8'):
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_ndjson(path, follow=False, poll_interval=1.0):
+    # NDJSONを1行ずつ読み込む
+    # follow=True の場合は、前段が「.done」マーカーを作るまでファイルの末尾で追記を待つ
+    marker = done_marker_path(path)
+    while follow and not os.path.exists(path):
+        if os.path.exists(marker):
+            return
+        time.sleep(poll_interval)
+    with open(path, 'r', encoding='utf-8') as f:
+        partial = ''
+        while True:
+            line = f.readline()
+            if line:
+                partial += line
+                if not partial.endswith('\n'):
+                    # 書き込み途中の行は続きが来るまで待つ
+                    if not follow:
+                        break
+                    continue
+                line, partial = partial.strip(), ''
+                if line:
+                    yield json.loads(line)
+                continue
+            if not follow:
+                break
+            # マーカーを確認してから残りを読み直し、終了直前の追記を取りこぼさない
+            if os.path.exists(marker):
+                follow = False
+                continue
+            time.sleep(poll_interval)
+        if partial.strip():
+            yield json.loads(partial)
@@ -0,0 +1,145 @@
+import json
+import os
+
+# 辞書ファイルの形式（JSON）:
+# {
+#     "format_version": 1,
+#     "version": "2024-11-01",
+#     "sentiment": {"positive": ["神ゲー", ...], "negative": [...]},
+#     "difficulty": {"difficult": [...], "easy": [...]},
+#     "stopwords": [...]
+# }
+# 各エントリは文字列、または形態素解析済みの原形のリスト（["バランス", "が", "取れる", "て", "いる"] など）で指定する。
+# 原形のリストは助詞なども含めた、品詞で絞り込まない列にする（照合も絞り込まない原形の列に対して行う）。
+# 原形のリストで指定したエントリは読み込み時に形態素解析をしないため、大きな辞書でも高速に読み込める。
+
+LEXICON_FORMAT_VERSION = 1
+
+CATEGORY_LABELS = {
+    'sentiment': {'positive': 'ポジティブ', 'negative': 'ネガティブ'},
+    'difficulty': {'difficult': '難しい', 'easy': '簡単'},
+}
+
+
+class PolarityIndex:
+    # 原形をキーにしたハッシュ索引と、複数トークンからなる表現のトライ木
+    def __init__(self):
+        self.words = {}
+        self.phrases = {}
+
+    def add(self, words, label, entry):
+        if not words:
+            return
+        # 先に登録されたラベルを優先する（ポジティブ→ネガティブの順に判定していた挙動を保つ）
+        if len(words) == 1:
+            self.words.setdefault(words[0], (label, words[0]))
+            return
+        node = self.phrases
+        for word in words:
+            node = node.setdefault(word, {})
+        node.setdefault(None, (label, entry))
+
+    def match(self, tokens):
+        # トークン列を先頭から走査し、複数トークンの表現を最長一致で優先して (ラベル, 表現) を返す
+        i = 0
+        n = len(tokens)
+        while i < n:
+            node = self.phrases
+            found = None
+            found_end = i
+            j = i
+            while j < n and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if None in node:
+                    found = node[None]
+                    found_end = j
+            if found is not None:
+                yield found
+                i = found_end
+                continue
+            hit = self.words.get(tokens[i])
+            if hit is not None:
+                yield hit
+            i += 1
+
+    def __len__(self):
+        def count(node):
+            return sum(1 if key is None else count(child) for key, child in node.items())
+        return len(self.words) + count(self.phrases)
+
+
+class Lexicon:
+    def __init__(self, version, indexes, stopwords):
+        self.version = version
+        self.indexes = indexes
+        self.stopwords = stopwords
+
+    @property
+    def sentiment(self):
+        return self.indexes['sentiment']
+
+    @property
+    def difficulty(self):
+        return self.indexes['difficulty']
+
+
+def empty_source():
+    return {
+        'format_version': LEXICON_FORMAT_VERSION,
+        'version': None,
+        'sentiment': {'positive': [], 'negative': []},
+        'difficulty': {'difficult': [], 'easy': []},
+        'stopwords': [],
+    }
+
+
+def load_lexicon_source(path):
+    # 辞書ファイルが存在しない場合は None を返す
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        source = json.load(f)
+    format_version = source.get('format_version')
+    if format_version != LEXICON_FORMAT_VERSION:
+        raise ValueError(f"未対応の辞書形式です: format_version={format_version} ({path})")
+    for group, labels in CATEGORY_LABELS.items():
+        for category in source.get(group, {}):
+            if category not in labels:
+                raise ValueError(f"不明な辞書カテゴリです: {group}.{category} ({path})")
+    return source
+
+
+def merge_sources(*sources):
+    merged = empty_source()
+    for source in sources:
+        if not source:
+            continue
+        if source.get('version') is not None:
+            merged['version'] = source['version']
+        for group, labels in CATEGORY_LABELS.items():
+            for category in labels:
+                merged[group][category].extend(source.get(group, {}).get(category, []))
+        merged['stopwords'].extend(source.get('stopwords', []))
+    return merged
+
+
+def compile_lexicon(source, tokenize, stopwords=frozenset()):
+    # 文字列のエントリは tokenize で（品詞などで絞り込まない）原形の列に変換してから索引に登録する
+    # 絞り込んだ列で登録すると「低品質」が「品質」になるなど、表現の意味が変わってしまう
+    indexes = {}
+    for group, labels in CATEGORY_LABELS.items():
+        index = PolarityIndex()
+        for category, label in labels.items():
+            for entry in source.get(group, {}).get(category, []):
+                if isinstance(entry, str):
+                    words, text = tokenize(entry), entry
+                else:
+                    words, text = list(entry), "".join(entry)
+                if not words:
+                    print(f"感情辞書のエントリ '{text}' ({group}.{category}) が空の原形の列になるため登録しません。")
+                    continue
+                index.add(words, label, text)
+        indexes[group] = index
+    stopwords = frozenset(stopwords) | frozenset(source.get('stopwords', []))
+    return Lexicon(source.get('version'), indexes, stopwords)
@@ -3,11 +3,21 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import asyncio
+import os
+import sys
+
 from scrapy import signals
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+# steamディレクトリのモジュールはスパイダーと同じくパスを通して読み込む
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from rate_budget import SharedRateBudget
+from token_provider import get_token_provider
+
 
 class SteamSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -101,3 +111,57 @@ class SteamDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class SharedRateBudgetMiddleware:
+    # fetch_top_games.py などの他のプロセスと共有するレート制限の枠を、リクエストの前に確保する
+    # 待機はイベントループ上で行い、他のリクエストの処理を止めない
+
+    def __init__(self, budgets=None):
+        self.budget = SharedRateBudget(budgets=budgets)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.getdict('RATE_BUDGETS'))
+
+    @staticmethod
+    def client_id(request):
+        value = request.headers.get('Client-ID')
+        return value.decode('latin-1') if value else None
+
+    async def process_request(self, request, spider):
+        client_id = self.client_id(request)
+        while True:
+            wait = self.budget.try_acquire(request.url, client_id)
+            if wait <= 0:
+                return None
+            await asyncio.sleep(wait)
+
+    def process_response(self, request, response, spider):
+        # HTTPキャッシュから返したレスポンスのヘッダーは古いため使わない
+        if 'cached' in response.flags:
+            return response
+        self.budget.update_from_headers(request.url, self.client_id(request), response.headers)
+        return response
+
+
+class TwitchTokenMiddleware:
+    # Twitch APIが401を返した場合はトークンを更新し、新しいトークンで1度だけやり直す
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls()
+
+    def process_response(self, request, response, spider):
+        if response.status != 401 or 'twitch.tv' not in request.url or request.meta.get('token_refreshed'):
+            return response
+        authorization = (request.headers.get('Authorization') or b'').decode('latin-1')
+        stale_token = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else None
+        provider = get_token_provider()
+        new_token = provider.refresh(stale_token)
+        if not new_token:
+            return response
+        headers = dict(request.headers.to_unicode_dict())
+        headers.update(provider.headers(new_token))
+        meta = dict(request.meta, token_refreshed=True)
+        return request.replace(headers=headers, meta=meta, dont_filter=True)
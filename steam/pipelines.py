@@ -3,11 +3,148 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import datetime
+import os
+import sys
+import time
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from psycopg2.extras import execute_values
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer, task, threads
+
+# steamディレクトリのモジュールはスパイダーと同じくパスを通して読み込む
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db
 
 
 class SteamPipeline:
     def process_item(self, item, spider):
         return item
+
+
+class PostgresPipeline:
+    # アイテムをためておき、一定件数または一定時間ごとに steam_data / steam_data_genres / game_views へ
+    # 複数行のINSERTでまとめて書き込む（書き込みは共有のコネクションプールを使って別スレッドで行い、クロールを止めない）
+
+    def __init__(self, batch_size=100, flush_interval=5.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.lock = None
+        self.timer = None
+        self.written = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('PG_PIPELINE_ENABLED', False):
+            raise NotConfigured("PG_PIPELINE_ENABLED is not set.")
+        if not db.is_configured():
+            raise NotConfigured("Database connection information is missing.")
+        return cls(
+            batch_size=crawler.settings.getint('PG_PIPELINE_BATCH_SIZE', 100),
+            flush_interval=crawler.settings.getfloat('PG_PIPELINE_FLUSH_INTERVAL', 5.0),
+        )
+
+    def open_spider(self, spider):
+        # 書き込みの順序を保つため、バッチは1つずつ直列に書き込む
+        self.lock = defer.DeferredLock()
+        self.timer = task.LoopingCall(self.flush_if_stale, spider)
+        self.timer.start(self.flush_interval, now=False)
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        self.buffer.append((datetime.datetime.now(), adapter.asdict()))
+        if len(self.buffer) >= self.batch_size:
+            self.flush(spider)
+        return item
+
+    def flush_if_stale(self, spider):
+        if self.buffer and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush(spider)
+
+    def flush(self, spider):
+        batch, self.buffer = self.buffer, []
+        self.last_flush = time.monotonic()
+        if not batch:
+            return None
+        d = self.lock.run(threads.deferToThread, self.write_pooled, batch)
+        d.addCallback(self.batch_written, spider, len(batch))
+        d.addErrback(self.batch_failed, spider, len(batch))
+        return d
+
+    def batch_written(self, _, spider, count):
+        self.written += count
+        spider.logger.debug("Wrote %d items to PostgreSQL", count)
+
+    def batch_failed(self, failure, spider, count):
+        spider.logger.error("Failed to write %d items to PostgreSQL: %s", count, failure.getErrorMessage())
+
+    @classmethod
+    def write_pooled(cls, batch):
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cls.write_batch(cur, batch)
+            conn.commit()
+
+    @staticmethod
+    def write_batch(cur, batch):
+        # 同じゲームが1つのINSERTに2回現れるとON CONFLICTが失敗するため、最後のものだけを残す
+        steam_data_values = {}
+        steam_data_genres_values = set()
+        game_views_values = []
+        for get_date, item in batch:
+            steam_data_values[item['steam_id']] = (
+                item['steam_id'], item['twitch_id'], item['game_title'], item['webpage_url'],
+                item['img_url'], item['price'], item['is_single_player'], item['is_multi_player'],
+                item['is_device_windows'], item['is_device_mac']
+            )
+            for genre in item.get('genres', []):
+                steam_data_genres_values.add((item['steam_id'], genre['id']))
+            game_views_values.append((
+                get_date, item['game_title'], item['twitch_id'], item['steam_id'], item['total_views']
+            ))
+
+        execute_values(cur, """
+            INSERT INTO steam_data (
+                steam_game_id, twitch_game_id, game_title, webpage_url, img_url, price,
+                is_single_player, is_multi_player, is_device_windows, is_device_mac
+            ) VALUES %s
+            ON CONFLICT (steam_game_id) DO UPDATE SET
+                twitch_game_id = EXCLUDED.twitch_game_id,
+                game_title = EXCLUDED.game_title,
+                webpage_url = EXCLUDED.webpage_url,
+                img_url = EXCLUDED.img_url,
+                price = EXCLUDED.price,
+                is_single_player = EXCLUDED.is_single_player,
+                is_multi_player = EXCLUDED.is_multi_player,
+                is_device_windows = EXCLUDED.is_device_windows,
+                is_device_mac = EXCLUDED.is_device_mac
+        """, list(steam_data_values.values()))
+
+        if steam_data_genres_values:
+            execute_values(cur, """
+                INSERT INTO steam_data_genres (steam_game_id, genre_id)
+                VALUES %s
+                ON CONFLICT (steam_game_id, genre_id) DO NOTHING
+            """, sorted(steam_data_genres_values))
+
+        execute_values(cur, """
+            INSERT INTO game_views (get_date, game_title, twitch_id, steam_id, total_views)
+            VALUES %s
+        """, game_views_values)
+
+    def close_spider(self, spider):
+        # 残りを書き込んでから接続を閉じる（Deferredを返すとScrapyは完了を待つ）
+        if self.timer is not None and self.timer.running:
+            self.timer.stop()
+        d = self.flush(spider) or defer.succeed(None)
+
+        def finish(_):
+            spider.logger.info("Wrote %d items to PostgreSQL", self.written)
+
+        d.addBoth(finish)
+        return d
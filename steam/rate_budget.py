@@ -0,0 +1,193 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+RATE_BUDGET_PATH = os.getenv('RATE_BUDGET_PATH', os.path.join(script_dir, 'rate_budget.db'))
+
+# エンドポイントごとの（バケットの容量, 1秒あたりの回復量）
+# キーは「ホスト」または「ホスト/パスの先頭部分」で、URLに最も長く一致するキーのバケットを使う
+# Twitchはレスポンスヘッダーの値で上書きされるため、ここは最初のリクエストまでの初期値
+# Steamストアは appdetails（5分に200回程度）と appreviews の制限が別のため、バケットを分ける
+# '*' は上記のどれにも一致しないホストの既定値（ホストごとに別のバケットになる）
+DEFAULT_BUDGETS = {
+    'api.twitch.tv': (800, 800 / 60),
+    'store.steampowered.com/api/appdetails': (10, 200 / 300),
+    'store.steampowered.com/appreviews': (20, 2.0),
+    'steam-active-scrape.netlify.app': (10, 5.0),
+    '*': (2, 2.0),
+}
+
+
+def load_budgets(value):
+    # RATE_BUDGETS='{"store.steampowered.com/appreviews": [20, 2.0], "*": [4, 4.0]}' の形式
+    if not value:
+        return {}
+    try:
+        return {
+            key: (float(capacity), float(refill_rate))
+            for key, (capacity, refill_rate) in json.loads(value).items()
+        }
+    except (ValueError, TypeError, AttributeError) as e:
+        raise ValueError(f"RATE_BUDGETS の形式が正しくありません: {e}")
+
+
+def _header_number(headers, name):
+    value = headers.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class SharedRateBudget:
+    # エンドポイントとclient_idごとのトークンバケットをSQLiteに置き、同じマシン上の複数のプロセスで共有する
+    # Ratelimit-Remaining / Ratelimit-Reset ヘッダーを受け取るたびに残量と回復速度を合わせる
+    # 制限は既定値、環境変数 RATE_BUDGETS、引数 budgets の順に上書きする
+    def __init__(self, path=RATE_BUDGET_PATH, budgets=None):
+        self.path = path
+        self.budgets = dict(DEFAULT_BUDGETS)
+        self.budgets.update(load_budgets(os.getenv('RATE_BUDGETS')))
+        self.budgets.update(budgets or {})
+        self._local = threading.local()
+        self._connect().execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                -- host にはバケットのキー（ホスト、またはホスト/パスの先頭部分）を入れる
+                host TEXT NOT NULL,
+                client_id TEXT NOT NULL,
+                tokens REAL NOT NULL,
+                capacity REAL NOT NULL,
+                refill_rate REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                reset_at REAL,
+                PRIMARY KEY (host, client_id)
+            )
+        """)
+
+    def _connect(self):
+        # 接続はスレッドごとに持ち、トランザクションは BEGIN IMMEDIATE で明示的に張る
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def budget_key(self, url):
+        # URLに最も長く一致するキーを返す。一致しない場合はホストをキーにする
+        parsed = urlparse(url)
+        target = parsed.netloc + parsed.path
+        matched = parsed.netloc
+        for key in self.budgets:
+            if len(key) <= len(matched) or not target.startswith(key):
+                continue
+            if len(target) == len(key) or key.endswith('/') or target[len(key)] == '/':
+                matched = key
+        return matched
+
+    def budget_for(self, key):
+        return self.budgets.get(key, self.budgets['*'])
+
+    def _load(self, conn, key, client_id, now):
+        row = conn.execute("""
+            SELECT tokens, capacity, refill_rate, updated_at, reset_at
+            FROM buckets WHERE host = ? AND client_id = ?
+        """, (key, client_id)).fetchone()
+        if row is None:
+            capacity, refill_rate = self.budget_for(key)
+            return capacity, capacity, refill_rate, now, None
+        tokens, capacity, refill_rate, updated_at, reset_at = row
+        if reset_at is None:
+            # ヘッダーで調整されていないバケットは、設定の変更が次の実行から効くよう設定値を使う
+            capacity, refill_rate = self.budget_for(key)
+        # 前回からの経過時間分だけ回復させる（リセット時刻を過ぎていれば満タンに戻す）
+        if reset_at is not None and updated_at < reset_at <= now:
+            tokens = capacity
+        else:
+            tokens = min(capacity, tokens + max(0.0, now - updated_at) * refill_rate)
+        return tokens, capacity, refill_rate, now, reset_at
+
+    def _save(self, conn, key, client_id, tokens, capacity, refill_rate, updated_at, reset_at):
+        conn.execute("""
+            INSERT INTO buckets (host, client_id, tokens, capacity, refill_rate, updated_at, reset_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (host, client_id) DO UPDATE SET
+                tokens = excluded.tokens,
+                capacity = excluded.capacity,
+                refill_rate = excluded.refill_rate,
+                updated_at = excluded.updated_at,
+                reset_at = excluded.reset_at
+        """, (key, client_id, tokens, capacity, refill_rate, updated_at, reset_at))
+
+    def try_acquire(self, url, client_id=None):
+        # トークンを1つ取れた場合は0を、取れなかった場合は待つべき秒数を返す
+        key = self.budget_key(url)
+        client_id = client_id or ''
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            tokens, capacity, refill_rate, now, reset_at = self._load(conn, key, client_id, time.time())
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / refill_rate
+            self._save(conn, key, client_id, tokens, capacity, refill_rate, now, reset_at)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def acquire(self, url, client_id=None):
+        while True:
+            wait = self.try_acquire(url, client_id)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def update_from_headers(self, url, client_id, headers):
+        remaining = _header_number(headers, 'Ratelimit-Remaining')
+        if remaining is None:
+            return
+        limit = _header_number(headers, 'Ratelimit-Limit')
+        reset = _header_number(headers, 'Ratelimit-Reset')
+        key = self.budget_key(url)
+        client_id = client_id or ''
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            tokens, capacity, refill_rate, now, reset_at = self._load(conn, key, client_id, time.time())
+            if limit:
+                capacity = limit
+            # 他のプロセスが送信中のリクエストはまだ残量に反映されていないため、少ない方を採る
+            tokens = min(tokens, remaining, capacity)
+            if reset is not None and reset > now:
+                reset_at = reset
+                if limit and remaining < limit:
+                    # リセット時刻までに満タンに戻る速度で回復させる
+                    refill_rate = (limit - remaining) / (reset - now)
+            self._save(conn, key, client_id, tokens, capacity, refill_rate, now, reset_at)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_rate_budget():
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = SharedRateBudget()
+    return _budget
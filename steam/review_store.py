@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+import time
+
+
+class ReviewStore:
+    # appidとrecommendationidをキーにレビューをローカルに保存するSQLiteストア
+    # 複数のスレッドから使われるため、接続は1つにしてロックで直列化する
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS reviews (
+                    appid INTEGER NOT NULL,
+                    recommendationid INTEGER NOT NULL,
+                    review TEXT NOT NULL,
+                    playtime_forever INTEGER NOT NULL DEFAULT 0,
+                    timestamp_created INTEGER NOT NULL DEFAULT 0,
+                    timestamp_updated INTEGER NOT NULL DEFAULT 0,
+                    voted_up INTEGER,
+                    PRIMARY KEY (appid, recommendationid)
+                );
+                CREATE INDEX IF NOT EXISTS reviews_recent
+                    ON reviews (appid, timestamp_created DESC, recommendationid DESC);
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    appid INTEGER PRIMARY KEY,
+                    high_water INTEGER NOT NULL,
+                    synced_at INTEGER NOT NULL
+                );
+            """)
+            self.conn.commit()
+
+    def high_water(self, appid):
+        # 保存済みのレビューの中で最も新しい作成時刻（未取得の場合はNone）
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT high_water FROM sync_state WHERE appid = ?", (int(appid),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def add_reviews(self, appid, raw_reviews):
+        rows = []
+        for review in raw_reviews:
+            if review.get('recommendationid') is None:
+                continue
+            rows.append((
+                int(appid),
+                int(review['recommendationid']),
+                review.get('review', ''),
+                review.get('author', {}).get('playtime_forever', 0),
+                review.get('timestamp_created', 0),
+                review.get('timestamp_updated', 0),
+                review.get('voted_up')
+            ))
+        if not rows:
+            return 0
+        with self.lock:
+            self.conn.executemany("""
+                INSERT INTO reviews (
+                    appid, recommendationid, review, playtime_forever,
+                    timestamp_created, timestamp_updated, voted_up
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (appid, recommendationid) DO UPDATE SET
+                    review = excluded.review,
+                    playtime_forever = excluded.playtime_forever,
+                    timestamp_updated = excluded.timestamp_updated,
+                    voted_up = excluded.voted_up
+            """, rows)
+            self.conn.execute("""
+                INSERT INTO sync_state (appid, high_water, synced_at)
+                SELECT appid, MAX(timestamp_created), ? FROM reviews WHERE appid = ?
+                ON CONFLICT (appid) DO UPDATE SET
+                    high_water = excluded.high_water,
+                    synced_at = excluded.synced_at
+            """, (int(time.time()), int(appid)))
+            self.conn.commit()
+        return len(rows)
+
+    def count(self, appid):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM reviews WHERE appid = ?", (int(appid),)).fetchone()[0]
+
+    def appids(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT DISTINCT appid FROM reviews ORDER BY appid")]
+
+    def iter_review_batches(self, appid, max_reviews, batch_size=100):
+        # 新しい順にレビューをページ単位で返す（APIのレスポンスと同じ形の辞書にする）
+        # ページごとに問い合わせを分け、他のスレッドの書き込みとカーソルを共有しない
+        last_key = None
+        fetched = 0
+        while fetched < max_reviews:
+            limit = min(batch_size, max_reviews - fetched)
+            with self.lock:
+                if last_key is None:
+                    rows = self.conn.execute("""
+                        SELECT recommendationid, review, playtime_forever, timestamp_created
+                        FROM reviews WHERE appid = ?
+                        ORDER BY timestamp_created DESC, recommendationid DESC LIMIT ?
+                    """, (int(appid), limit)).fetchall()
+                else:
+                    rows = self.conn.execute("""
+                        SELECT recommendationid, review, playtime_forever, timestamp_created
+                        FROM reviews WHERE appid = ? AND (timestamp_created, recommendationid) < (?, ?)
+                        ORDER BY timestamp_created DESC, recommendationid DESC LIMIT ?
+                    """, (int(appid), last_key[0], last_key[1], limit)).fetchall()
+            if not rows:
+                return
+            fetched += len(rows)
+            last_key = (rows[-1][3], rows[-1][0])
+            yield [
+                {
+                    'recommendationid': str(recommendationid),
+                    'review': review,
+                    'author': {'playtime_forever': playtime_forever},
+                    'timestamp_created': timestamp_created
+                }
+                for recommendationid, review, playtime_forever, timestamp_created in rows
+            ]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
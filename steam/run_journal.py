@@ -0,0 +1,83 @@
+import json
+import os
+import time
+
+# fsyncをまとめて行う件数と間隔（秒）
+FSYNC_EVERY = 10
+FSYNC_INTERVAL = 5.0
+
+
+def journal_path_for(output_file):
+    return output_file + '.journal'
+
+
+class RunJournal:
+    # 処理し終えたゲームの結果を1行ずつ追記するジャーナル
+    # 途中で異常終了しても、再開時にはジャーナルにあるゲームを飛ばして続きから処理できる
+    def __init__(self, path, resume=False, fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.records = {}
+        if resume:
+            self._load()
+        # 1回の write で1行を書き込み、O_APPEND で行が混ざらないようにする
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        if not resume:
+            flags |= os.O_TRUNC
+        self.fd = os.open(path, flags, 0o644)
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def _load(self):
+        # 最後の行が書き込み途中で切れている場合は、そこから後ろを切り捨てる
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            valid_end = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                self.records[str(entry['steam_id'])] = entry['record']
+                valid_end += len(line)
+        if valid_end < os.path.getsize(self.path):
+            os.truncate(self.path, valid_end)
+
+    def __contains__(self, steam_id):
+        return str(steam_id) in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, steam_id, record):
+        line = json.dumps({'steam_id': steam_id, 'record': record}, ensure_ascii=False) + '\n'
+        os.write(self.fd, line.encode('utf-8'))
+        self.records[str(steam_id)] = record
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        if self.unsynced:
+            os.fsync(self.fd)
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if self.fd is None:
+            return
+        self.sync()
+        os.close(self.fd)
+        self.fd = None
+
+    def discard(self):
+        # 最終的な出力を書き終えたら、ジャーナルは不要になる
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -20,14 +20,16 @@ NEWSPIDER_MODULE = "steam.spiders"
 ROBOTSTXT_OBEY = False
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-CONCURRENT_REQUESTS = 1
+CONCURRENT_REQUESTS = 32
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
-DOWNLOAD_DELAY = 1
+# リクエスト間隔は SharedRateBudgetMiddleware が他のプロセスと共有する枠で制御する
+#DOWNLOAD_DELAY = 1
 # The download delay setting will honor only one of:
-#CONCURRENT_REQUESTS_PER_DOMAIN = 16
+# 同時接続数はドメインごとに上限を設け、その範囲でAutoThrottleに調整させる
+CONCURRENT_REQUESTS_PER_DOMAIN = 8
 #CONCURRENT_REQUESTS_PER_IP = 16
 
 # Disable cookies (enabled by default)
@@ -50,9 +52,15 @@ DOWNLOAD_DELAY = 1
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "steam.middlewares.SteamDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    # HTTPキャッシュ（900）より後に置き、キャッシュにないリクエストだけ枠を消費する
+    "steam.middlewares.SharedRateBudgetMiddleware": 950,
+    # 401を受けたらトークンを更新してやり直す
+    "steam.middlewares.TwitchTokenMiddleware": 940,
+}
+# エンドポイントごとの制限（容量, 1秒あたりの回復量）を rate_budget.DEFAULT_BUDGETS から上書きする
+# 例: {"store.steampowered.com/appreviews": (20, 2.0)}（環境変数 RATE_BUDGETS でも指定できる）
+RATE_BUDGETS = {}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
@@ -62,20 +70,28 @@ DOWNLOAD_DELAY = 1
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    "steam.pipelines.SteamPipeline": 300,
-#}
+# PostgresPipelineは game_views にも直接書き込むため、insert_views_to_db.py と併用すると
+# 同じスナップショットが二重に登録される。既定では無効にしておき、クロール結果をそのまま
+# データベースに書き込みたい場合だけ `scrapy crawl items -s PG_PIPELINE_ENABLED=1` で有効にする
+# （その場合は insert_views_to_db.py を実行しない）
+# PostgreSQLの接続情報（PGHOSTなど）がない場合も、PostgresPipelineは無効になる
+ITEM_PIPELINES = {
+    "steam.pipelines.PostgresPipeline": 300,
+}
+PG_PIPELINE_ENABLED = False
+PG_PIPELINE_BATCH_SIZE = 100
+PG_PIPELINE_FLUSH_INTERVAL = 5.0
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
-#AUTOTHROTTLE_ENABLED = True
+AUTOTHROTTLE_ENABLED = True
 # The initial download delay
-#AUTOTHROTTLE_START_DELAY = 5
+AUTOTHROTTLE_START_DELAY = 1
 # The maximum download delay to be set in case of high latencies
-#AUTOTHROTTLE_MAX_DELAY = 60
+AUTOTHROTTLE_MAX_DELAY = 60
 # The average number of requests Scrapy should be sending in parallel to
 # each remote server
-#AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
+AUTOTHROTTLE_TARGET_CONCURRENCY = 4.0
 # Enable showing throttling stats for every response received:
 #AUTOTHROTTLE_DEBUG = False
 
@@ -1,3 +1,4 @@
+import asyncio
 import scrapy
 import json
 import os
@@ -8,23 +9,22 @@ parent_dir = os.path.abspath(os.path.join(script_dir, os.pardir))
 token_path = os.path.join(parent_dir, 'getAccessToken.py')
 sys.path.append(parent_dir)
 
-from getAccessToken import get_access_token
+from token_provider import get_token_provider
+from app_index import AppIndex
+from title_matcher import TitleMatcher
 
 from dotenv import load_dotenv
 # load_dotenv()
 
-CLIENT_ID = os.getenv('CLIENT_ID')
-
 class ItemsSpider(scrapy.Spider):
     name = 'items'
     allowed_domains = ['api.twitch.tv', 'api.steampowered.com']
     base_url = 'https://api.twitch.tv/helix/games/top'
-    token = get_access_token()
 
-    twitch_headers = {
-        'Client-ID': CLIENT_ID,
-        'Authorization': f'Bearer {token}',
-    }
+    @property
+    def twitch_headers(self):
+        # トークンはクラス定義時ではなく、最初のTwitchへのリクエストを作るときに解決する
+        return get_token_provider().headers()
 
     steam_headers = {
         'Accept-Language': 'ja'
@@ -35,57 +35,66 @@ class ItemsSpider(scrapy.Spider):
         'FEED_URI': 'twitch_top_games.json'
     }
 
-    def transform_data_to_dict(self, data):
-        transformed_dict = {}
-        for item in data:
-            name = item.get('name')
-            appid = item.get('appid')
-            if name and appid:
-                transformed_dict[name] = appid
-        return transformed_dict
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # ページをまたいで持ち回る状態はmetaではなくスパイダーに置く
+        self.matcher = None
+        self.app_index_task = None
+        self.dispatched_ids = set()
 
     def start_requests(self):
-        url = self.base_url + '?first=100'
-        yield scrapy.Request(url, headers=self.twitch_headers, callback=self.parse_twitch, meta={'top_games_index': 0, 'top_games': []})
+        # アプリ索引の更新（AppIndex.refresh）は別スレッドで始め、Twitchのページングと並行させる
+        # STEAM_API_KEY がある場合は前回の同期以降の差分だけを毎回取得し、ない場合は索引が古くなった
+        # ときだけ全件をストリームで取り込み直す（レスポンス全体をメモリに載せない）
+        self.app_index_task = asyncio.ensure_future(asyncio.to_thread(self.refresh_app_index))
 
-    def parse_twitch(self, response):
+        url = self.base_url + '?first=100'
+        yield scrapy.Request(url, headers=self.twitch_headers, callback=self.parse_twitch)
+
+    def refresh_app_index(self):
+        # SQLiteの接続はスレッドをまたいで使えないため、このスレッドで開いて閉じる
+        app_index = AppIndex()
+        try:
+            updated = app_index.refresh()
+            if updated:
+                self.logger.info(f"Steamのアプリ索引を更新しました: {updated} 件")
+        except Exception as e:
+            self.logger.warning(f"Steamのアプリ索引の更新に失敗しました。保存済みの索引を使用します: {e}")
+        finally:
+            app_index.close()
+
+    async def get_matcher(self):
+        # 索引の更新が終わるのを待ち、照合に使う索引は最初に必要になったときに一度だけ開く
+        await self.app_index_task
+        if self.matcher is None:
+            self.matcher = TitleMatcher(AppIndex())
+        return self.matcher
+
+    async def parse_twitch(self, response):
         top_games_json = json.loads(response.body)
         cursor = top_games_json.get('pagination', {}).get('cursor', None)
         top_games = top_games_json['data']
 
-        prev_top_games = response.meta['top_games']
-        top_games = prev_top_games + top_games
-
-        top_games_index = response.meta['top_games_index'] + 1
-        
         if cursor:
             url = f'https://api.twitch.tv/helix/games/top?first=100&after={cursor}'
-            yield scrapy.Request(
-                url,
-                headers=self.twitch_headers,
-                callback=self.parse_twitch,
-                meta={'top_games_index': top_games_index, 'top_games': top_games}
-            )
-        else:
-            url = 'https://api.steampowered.com/ISteamApps/GetAppList/v2/'
-            yield scrapy.Request(
-                url,
-                headers=self.steam_headers,
-                callback=self.parse_games,
-                meta={'top_games': top_games}
-            )
+            yield scrapy.Request(url, headers=self.twitch_headers, callback=self.parse_twitch)
 
-    def parse_games(self, response):
-        steam_games_json = json.loads(response.body)
-        steam_games_dict = self.transform_data_to_dict(steam_games_json['applist']['apps'])
-        top_games = response.meta['top_games']
+        # 次のページの取得を先に始めてから、アプリ索引の更新が終わるのを待って照合する
+        await self.get_matcher()
+        for request in self.match_games(top_games):
+            yield request
 
+    def match_games(self, top_games):
         for game in top_games:
             game_title = game['name']
             twitch_id = game['id']
+            # 同じゲームがページをまたいで重複した場合は一度だけ取得する
+            if game_title == 'Just Chatting' or twitch_id in self.dispatched_ids:
+                continue
 
-            if game_title in steam_games_dict and game_title != 'Just Chatting':
-                steam_id = steam_games_dict[game_title]
+            steam_id = self.matcher.match(twitch_id, game_title)
+            if steam_id:
+                self.dispatched_ids.add(twitch_id)
                 steam_url = f'https://store.steampowered.com/api/appdetails?appids={steam_id}&cc=jp'
                 yield scrapy.Request(
                     steam_url,
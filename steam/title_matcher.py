@@ -0,0 +1,131 @@
+import re
+import time
+import unicodedata
+
+# NFKCで「TM」などの文字に展開される前に取り除く記号
+TRADEMARK_RE = re.compile('[™®©℠]')
+
+# 続編や年度版を区別するための番号（算用数字とローマ数字）
+TITLE_TOKEN_RE = re.compile(r'\d+|[^\W\d_]+')
+ROMAN_NUMERAL_RE = re.compile(r'^(x{0,3})(ix|iv|v?i{0,3})$')
+ROMAN_VALUES = {'i': 1, 'v': 5, 'x': 10}
+
+FUZZY_THRESHOLD = 0.8
+FUZZY_CANDIDATES = 20
+# あいまい一致の結果と、見つからなかった結果を照合し直すまでの期間（秒）
+FUZZY_TTL = 7 * 24 * 60 * 60
+MISS_TTL = 24 * 60 * 60
+
+
+def normalize_title(title):
+    # 大文字・小文字、全角・半角、商標記号、記号や空白の違いを吸収したキーを作る
+    title = TRADEMARK_RE.sub('', title or '')
+    title = unicodedata.normalize('NFKC', title).casefold()
+    return ''.join(char for char in title if char.isalnum())
+
+
+def roman_to_int(numeral):
+    total = 0
+    for i, char in enumerate(numeral):
+        value = ROMAN_VALUES[char]
+        if i + 1 < len(numeral) and ROMAN_VALUES[numeral[i + 1]] > value:
+            total -= value
+        else:
+            total += value
+    return total
+
+
+def title_numbers(title):
+    # 「NBA 2K26」→ {2, 26}、「Dark Souls III」→ {3} のように、タイトル中の番号を取り出す
+    title = unicodedata.normalize('NFKC', TRADEMARK_RE.sub('', title or '')).casefold()
+    numbers = set()
+    for token in TITLE_TOKEN_RE.findall(title):
+        if token.isdigit():
+            numbers.add(int(token))
+        elif ROMAN_NUMERAL_RE.match(token):
+            numbers.add(roman_to_int(token))
+    return numbers
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def dice_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class TitleMatcher:
+    # Twitchのゲーム名をSteamのappidに対応付ける
+    # 完全一致 → 正規化したキーでの一致 → トライグラムによるあいまい一致の順に探す
+    # 完全一致・正規化での一致は確定した対応として保存し、次回以降は照合を省略する
+    # あいまい一致と見つからなかった結果は推測として別に保存し、一定期間が過ぎたら照合し直す
+    def __init__(self, app_index, fuzzy_threshold=FUZZY_THRESHOLD, fuzzy_ttl=FUZZY_TTL, miss_ttl=MISS_TTL):
+        self.app_index = app_index
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_ttl = fuzzy_ttl
+        self.miss_ttl = miss_ttl
+
+    def match(self, twitch_id, title):
+        if twitch_id:
+            cached = self.app_index.get_mapping(twitch_id)
+            if cached:
+                return cached
+            guess = self.app_index.get_guess(twitch_id)
+            if guess and self.is_guess_valid(guess, title):
+                return guess[0]
+
+        appid, method, score = self.find(title)
+        if twitch_id:
+            if method in ('exact', 'normalized'):
+                self.app_index.save_mapping(twitch_id, appid, title, method)
+            else:
+                self.app_index.save_guess(twitch_id, appid, title, score)
+        return appid
+
+    def is_guess_valid(self, guess, title):
+        # Twitch側の名前が変わった場合や期限を過ぎた場合は照合し直す
+        steam_appid, twitch_name, checked_at = guess
+        ttl = self.fuzzy_ttl if steam_appid else self.miss_ttl
+        return twitch_name == title and time.time() - (checked_at or 0) < ttl
+
+    def find(self, title):
+        appid = self.app_index.get(title)
+        if appid:
+            return appid, 'exact', 1.0
+
+        key = normalize_title(title)
+        if not key:
+            return None, None, None
+        appid = self.app_index.get_normalized(key)
+        if appid:
+            return appid, 'normalized', 1.0
+
+        appid, score = self.find_fuzzy(key, title)
+        if appid:
+            return appid, 'fuzzy', score
+        return None, None, score
+
+    def find_fuzzy(self, key, title=None):
+        grams = trigrams(key)
+        if not grams:
+            return None, None
+        numbers = title_numbers(title if title is not None else key)
+        best_appid = None
+        best_score = 0.0
+        ambiguous = False
+        for appid, candidate_key, candidate_name in self.app_index.fuzzy_candidates(grams, limit=FUZZY_CANDIDATES):
+            # 番号が異なるものは続編や別の年度版なので、似ていても同じゲームとみなさない
+            if title_numbers(candidate_name) != numbers:
+                continue
+            score = dice_similarity(grams, trigrams(candidate_key))
+            if score > best_score:
+                best_appid, best_score, ambiguous = appid, score, False
+            elif score == best_score and candidate_key != key:
+                ambiguous = True
+        # 同点の候補が複数ある場合は誤った対応付けを避けるため採用しない
+        if best_score >= self.fuzzy_threshold and not ambiguous:
+            return best_appid, best_score
+        return None, best_score
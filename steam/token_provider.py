@@ -0,0 +1,151 @@
+import importlib.util
+import json
+import os
+import threading
+import time
+
+import requests
+
+import http_client
+from getAccessToken import get_access_token_record
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+TOKEN_CACHE_PATH = os.getenv('TOKEN_CACHE_PATH', os.path.join(script_dir, '.twitch_token.json'))
+TWITCH_MAIN_PATH = os.path.abspath(os.path.join(script_dir, os.pardir, 'twitch', 'main.py'))
+
+# 有効期限の直前に使い始めたトークンが途中で切れないよう、少し早めに更新する
+EXPIRY_MARGIN = 60
+
+
+def _load_twitch_main():
+    # トークンの発行は twitch/main.py と同じ処理を使う
+    spec = importlib.util.spec_from_file_location('twitch_main', TWITCH_MAIN_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TokenProvider:
+    # Twitchのアクセストークンを初めて使うときに解決し、プロセス内とローカルのファイルにキャッシュする
+    # メモリ → ファイル → データベース → 新規発行の順に、有効期限内のものを探す
+    def __init__(self, cache_path=TOKEN_CACHE_PATH, client_id=None):
+        self.cache_path = cache_path
+        self.client_id = client_id or os.getenv('CLIENT_ID')
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def _is_valid(self, expires_at):
+        return expires_at - EXPIRY_MARGIN > time.time()
+
+    def _set(self, token, expires_at):
+        self._token = token
+        self._expires_at = expires_at
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if cached.get('client_id') != self.client_id or not self._is_valid(cached.get('expires_at', 0)):
+            return False
+        self._set(cached['token'], cached['expires_at'])
+        return True
+
+    def _save_cache(self):
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'client_id': self.client_id, 'token': self._token, 'expires_at': self._expires_at}, f)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"トークンのキャッシュを保存できませんでした: {e}")
+
+    def _load_database(self):
+        record = get_access_token_record()
+        if record is None:
+            return False
+        token, expires_time = record
+        expires_at = expires_time.timestamp()
+        if not self._is_valid(expires_at):
+            return False
+        self._set(token, expires_at)
+        self._save_cache()
+        return True
+
+    def _mint(self):
+        # CLIENT_ID / CLIENT_SECRET が未設定の場合や通信に失敗した場合は、例外にせず取得失敗として扱う
+        try:
+            twitch_main = _load_twitch_main()
+            result = twitch_main.getTwitchAccessToken()
+        except KeyError as e:
+            print(f"トークンを発行できませんでした: 環境変数 {e} が設定されていません。")
+            return False
+        except (requests.RequestException, ValueError) as e:
+            print(f"トークンを発行できませんでした: {e}")
+            return False
+        if not result:
+            return False
+        token, expires_time = result
+        self._set(token, expires_time.timestamp())
+        self._save_cache()
+        # 他のジョブも使えるようにデータベースにも保存する（失敗してもこのプロセスでは使える）
+        try:
+            twitch_main.insert_token_to_db(token, expires_time)
+        except Exception as e:
+            print(f"新しいトークンをデータベースに保存できませんでした: {e}")
+        return True
+
+    def token(self):
+        with self._lock:
+            if self._token and self._is_valid(self._expires_at):
+                return self._token
+            if self._load_cache() or self._load_database() or self._mint():
+                return self._token
+            print("アクセストークンを取得できませんでした。")
+            return None
+
+    def refresh(self, stale_token=None):
+        # 401を受けたトークンを捨てて新しいトークンを発行する
+        # 別のスレッドがすでに更新していれば、そのトークンを使う
+        with self._lock:
+            if self._token and self._token != stale_token and self._is_valid(self._expires_at):
+                return self._token
+            self._set(None, 0.0)
+            if self._mint():
+                return self._token
+            print("アクセストークンを更新できませんでした。")
+            return None
+
+    def headers(self, token=None):
+        return {
+            'Client-ID': self.client_id,
+            'Authorization': f'Bearer {token or self.token()}',
+        }
+
+    def request(self, method, url, headers=None, **kwargs):
+        # Twitch APIへのリクエストに認証ヘッダーを付け、401の場合はトークンを更新して1度だけやり直す
+        token = self.token()
+        response = http_client.request(method, url, headers={**(headers or {}), **self.headers(token)}, **kwargs)
+        if response.status_code == 401:
+            new_token = self.refresh(token)
+            if new_token:
+                response = http_client.request(method, url, headers={**(headers or {}), **self.headers(new_token)}, **kwargs)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_token_provider():
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = TokenProvider()
+    return _provider
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import psycopg2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'steam'))
+
+import insert_data_to_db
+
+
+class FakeCursor:
+    # 実行されたSQLを記録し、価格が 'bad' のゲームの行の挿入だけを失敗させる
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+        if sql.lstrip().startswith('INSERT INTO stage_') and 'bad' in (params or ()):
+            raise psycopg2.DataError('invalid input syntax for type numeric: "bad"')
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.cursor_instance = FakeCursor()
+        self.committed = False
+
+    def cursor(self):
+        return self.cursor_instance
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+
+def fake_execute_values(cursor, sql, rows, page_size=None):
+    cursor.execute(sql, None)
+    if any('bad' in row for row in rows):
+        raise psycopg2.DataError('invalid input syntax for type numeric: "bad"')
+
+
+def test_bulk_load_prunes_quarantined_rows_with_integer_ids(tmp_path, monkeypatch):
+    monkeypatch.setattr(insert_data_to_db, 'execute_values', fake_execute_values)
+    games = [
+        {'steam_id': '10', 'twitch_id': '1', 'game_title': 'A', 'price': '100'},
+        {'steam_id': '20', 'twitch_id': '2', 'game_title': 'B', 'price': 'bad'},
+    ]
+    conn = FakeConnection()
+    quarantine_path = tmp_path / 'quarantine.jsonl'
+
+    loaded = insert_data_to_db.bulk_load(conn, games, '2026-10-18', str(quarantine_path))
+
+    assert loaded == 1
+    assert conn.committed
+    assert quarantine_path.read_text(encoding='utf-8').count('\n') == 1
+    deletes = [(sql, params) for sql, params in conn.cursor_instance.statements if sql.startswith('DELETE')]
+    assert len(deletes) == len(insert_data_to_db.BULK_TABLES)
+    for sql, (steam_ids,) in deletes:
+        # 文字列のまま渡すと text[] になり、bigint の列との比較でエラーになる
+        assert '::bigint[]' in sql
+        assert steam_ids == [20]
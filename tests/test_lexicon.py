@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'steam'))
+
+import fetch_and_parse_steam as fps
+from lexicon import compile_lexicon, merge_sources
+
+
+def labels(index, text):
+    return [label for label, entry in index.match(fps.tokenize_base_forms(text))]
+
+
+def test_prefixed_entry_keeps_its_prefix():
+    # 「低品質」が「品質」として登録されると、「品質が高い」がネガティブになってしまう
+    lexicon = fps.get_lexicon()
+    assert 'ネガティブ' not in labels(lexicon.sentiment, "品質が高い")
+    assert labels(lexicon.sentiment, "低品質なテクスチャ") == ['ネガティブ']
+
+
+def test_compound_entry_does_not_match_its_stem():
+    # 「わかりやすい」が「わかる」として登録されると、「よくわからない」が簡単として数えられる
+    lexicon = fps.get_lexicon()
+    assert '簡単' not in labels(lexicon.difficulty, "よくわからない")
+    assert labels(lexicon.difficulty, "操作がわかりやすい") == ['簡単']
+
+
+def test_adverb_entry_is_not_dropped():
+    # 副詞の「楽々」は品詞で絞り込むと空になり、登録されずに消えていた
+    lexicon = fps.get_lexicon()
+    assert labels(lexicon.difficulty, "楽々クリアできた") == ['簡単']
+
+
+def test_empty_entry_is_reported(capsys):
+    source = merge_sources({'sentiment': {'positive': ['。']}})
+    lexicon = compile_lexicon(source, lambda text: [])
+    assert len(lexicon.sentiment) == 0
+    assert '。' in capsys.readouterr().out
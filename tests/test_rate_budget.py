@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'steam'))
+
+from rate_budget import SharedRateBudget
+
+
+def test_store_endpoints_have_separate_buckets(tmp_path):
+    budget = SharedRateBudget(str(tmp_path / 'budget.db'))
+    assert budget.budget_key('https://store.steampowered.com/api/appdetails?appids=10&cc=jp') == \
+        'store.steampowered.com/api/appdetails'
+    assert budget.budget_key('https://store.steampowered.com/appreviews/10?json=1') == \
+        'store.steampowered.com/appreviews'
+    assert budget.budget_key('https://api.twitch.tv/helix/videos?game_id=1') == 'api.twitch.tv'
+    # 一致するキーがないホストは、既定値の制限でホストごとのバケットになる
+    assert budget.budget_key('https://example.com/a') == 'example.com'
+    assert budget.budget_for('example.com') == budget.budgets['*']
+
+    # 容量を使い切るまでレビューのページを取得しても、appdetails の枠は減らない
+    capacity, _ = budget.budget_for('store.steampowered.com/appreviews')
+    for _ in range(int(capacity)):
+        assert budget.try_acquire('https://store.steampowered.com/appreviews/10') == 0
+    assert budget.try_acquire('https://store.steampowered.com/appreviews/10') > 0
+    assert budget.try_acquire('https://store.steampowered.com/api/appdetails?appids=10') == 0
+
+
+def test_budgets_can_be_overridden_from_the_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv('RATE_BUDGETS', '{"store.steampowered.com/appreviews": [5, 1], "*": [4, 4]}')
+    budget = SharedRateBudget(str(tmp_path / 'budget.db'))
+    assert budget.budget_for('store.steampowered.com/appreviews') == (5.0, 1.0)
+    assert budget.budget_for('example.com') == (4.0, 4.0)
@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'steam'))
+
+import fetch_and_parse_steam as fps
+from idf_model import IdfModel, document_frequency_delta
+
+BATCHES = [
+    [
+        {'recommendationid': '1', 'review': "グラフィックが綺麗で音楽も最高。", 'author': {'playtime_forever': 120}},
+        {'recommendationid': '2', 'review': "ストーリーは退屈だった。", 'author': {'playtime_forever': 30}},
+    ],
+    [
+        {'recommendationid': '3', 'review': "難易度が高いがボス戦は楽しい。", 'author': {'playtime_forever': 600}},
+        {'recommendationid': '4', 'review': "音楽が素晴らしい。グラフィックは微妙。", 'author': {'playtime_forever': 45}},
+    ],
+]
+
+
+def idf_model():
+    tokenized = [" ".join(fps.AnalyzedReview(review['review']).content_words())
+                 for batch in BATCHES for review in batch]
+    model = IdfModel()
+    model.stage(document_frequency_delta(tokenized[:2]), [1, 2])
+    model.commit()
+    return model
+
+
+def test_merged_batches_match_a_single_accumulator():
+    # ワーカープロセスでページごとに解析して合算した結果は、1か所でまとめて解析した結果と同じになる
+    for model in (None, idf_model()):
+        single = fps.ReviewAccumulator(fps.ASPECT_EXPRESSIONS, idf_model=model)
+        merged = fps.ReviewAccumulator(fps.ASPECT_EXPRESSIONS, idf_model=model)
+        for batch in BATCHES:
+            single.add_batch(batch)
+            part = fps.ReviewAccumulator(fps.ASPECT_EXPRESSIONS, idf_model=model)
+            part.add_batch(batch)
+            merged.merge(part.partial())
+        assert merged.summary() == single.summary()
+
+
+def test_global_idf_does_not_keep_tokenized_reviews():
+    accumulator = fps.ReviewAccumulator(fps.ASPECT_EXPRESSIONS, idf_model=idf_model())
+    for batch in BATCHES:
+        accumulator.add_batch(batch)
+    assert accumulator.tokenized_reviews == []
+    assert accumulator.word_weights()
+
+
+def test_review_batch_queue_passes_pages_in_order():
+    assert list(fps.ReviewBatchQueue(iter(BATCHES), maxsize=1)) == BATCHES
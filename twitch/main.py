@@ -1,37 +1,30 @@
-import requests
 import os
+import sys
 from dotenv import load_dotenv
-import psycopg2
 import datetime
 
+# steamディレクトリの共有HTTPクライアントを使う
+script_dir = os.path.dirname(os.path.abspath(__file__))
+steam_dir = os.path.abspath(os.path.join(script_dir, os.pardir, 'steam'))
+sys.path.append(steam_dir)
+
+import db
+import http_client
+
 
 def insert_token_to_db(new_token, expires_time):
-    
     try:
-        connect = psycopg2.connect(
-            host      = os.getenv('PGHOST'),
-            user      = os.getenv('PGUSER'),
-            password  = os.getenv('PGPASSWORD'),
-            dbname    = os.getenv('PGDATABASE'),
-            port      = os.getenv('PGPORT')
-        )
-        cur = connect.cursor()
-
-        cur.execute(
-            """INSERT INTO access_token (token, get_date, expires_time, client_id) VALUES (%s, %s, %s, %s)""",
-            (new_token, datetime.datetime.now(), expires_time, os.environ['CLIENT_ID'])
-        )
-
-        connect.commit()
+        with db.connection() as connect, connect.cursor() as cur:
+            cur.execute(
+                """INSERT INTO access_token (token, get_date, expires_time, client_id) VALUES (%s, %s, %s, %s)""",
+                (new_token, datetime.datetime.now(), expires_time, os.environ['CLIENT_ID'])
+            )
+
+            connect.commit()
         print("データーベースに追加しました。")
     except Exception as e:
         print(e)
         print("データーベースに追加できませんでした。")
-    finally:
-        if cur:
-            cur.close()
-        if connect:
-            connect.close()
 
 def getTwitchAccessToken():
     url = "https://id.twitch.tv/oauth2/token"
@@ -42,7 +35,7 @@ def getTwitchAccessToken():
         "scope": "user:edit clips:edit",
     }
 
-    response = requests.post(url, data=data)
+    response = http_client.post(url, data=data)
 
     if response.status_code == 200:
         parsed = response.json()